@@ -0,0 +1,310 @@
+# End-to-end load test: drives on_message with synthetic Discord messages
+# against a local stand-in for the GitHub contents API, entirely offline.
+#
+#   python bench/loadtest.py [-n 20000] [-c 50] [--users 500] [--guilds 20]
+#                            [--top-1000 50000] [--latency 0.05] [--conflict-rate 0.1]
+#                            [--backend github|sqlite] [--batch 10] [--trace-memory]
+#
+# The stand-in serves GET/PUT /repos/{owner}/{repo}/contents/{path} with the
+# same sha rules as GitHub (a PUT with a stale sha gets a 422), ETags, and
+# optional latency. --conflict-rate makes a PUT lose to a simulated other
+# writer that often, to exercise the merge/retry path. Reports handler
+# throughput and latency, write queue wait, save times, GitHub traffic and
+# memory growth.
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+class FakeGitHub:
+    def __init__(self, latency=0.0, jitter=0.0, conflict_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.conflict_rate = conflict_rate
+        self.files = {}
+        self.requests = {}
+        self.conflicts = 0
+        self.bytes_written = 0
+        self.app = web.Application(client_max_size=64 * 1024 * 1024)
+        self.app.router.add_get("/repos/{owner}/{repo}/contents/{path:.+}", self.get)
+        self.app.router.add_put("/repos/{owner}/{repo}/contents/{path:.+}", self.put)
+        self.runner = None
+
+    async def start(self):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        return site._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    def seed(self, path, doc):
+        content = base64.b64encode(json.dumps(doc).encode()).decode()
+        self.files[path] = (content, hashlib.sha1(content.encode()).hexdigest())
+
+    async def delay(self, method):
+        self.requests[method] = self.requests.get(method, 0) + 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.random() * self.jitter)
+
+    async def get(self, request):
+        await self.delay("GET")
+        path = request.match_info["path"]
+        if path not in self.files:
+            return web.json_response({"message": "Not Found"}, status=404)
+        content, sha = self.files[path]
+        etag = f'"{sha}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.json_response({"path": path, "sha": sha, "content": content}, headers={"ETag": etag})
+
+    async def put(self, request):
+        await self.delay("PUT")
+        path = request.match_info["path"]
+        body = await request.json()
+        current = self.files.get(path)
+        if current is not None and random.random() < self.conflict_rate:
+            # someone else committed this file first
+            current = self.files[path] = (current[0], hashlib.sha1(current[1].encode()).hexdigest())
+        if (current[1] if current else None) != body.get("sha"):
+            self.conflicts += 1
+            return web.json_response({"message": f"{path} does not match {body.get('sha')}"}, status=422)
+        sha = hashlib.sha1(body["content"].encode()).hexdigest()
+        self.files[path] = (body["content"], sha)
+        self.bytes_written += len(body["content"])
+        return web.json_response({"content": {"path": path, "sha": sha}}, status=200 if current else 201)
+
+
+class FakeUser:
+    bot = False
+
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.display_name = self.name
+        self.mention = f"<@{user_id}>"
+
+    def __str__(self):
+        return self.name
+
+
+class FakeGuild:
+    shard_id = 0
+
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.name = f"guild{guild_id}"
+
+
+class FakeChannel:
+    def __init__(self, channel_id, latency=0.0):
+        self.id = channel_id
+        self.mention = f"<#{channel_id}>"
+        self.latency = latency
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent += 1
+
+
+class FakeMessage:
+    def __init__(self, author, guild, channel, content):
+        self.author = author
+        self.guild = guild
+        self.channel = channel
+        self.content = content
+        self.mentions = []
+
+
+def seed_leaderboards(github, size, rng):
+    rolls = [
+        {
+            "name": "Seeded", "rarity": int(1000 * (1 / (1 - rng.random())) ** 2), "user": "seed", "user_id": 1,
+            "server": "seed", "timestamp": 0, "roll_number": i + 1
+        }
+        for i in range(size)
+    ]
+    rolls.sort(key=lambda r: r["rarity"], reverse=True)
+    github.seed("stats.json", {"total_rolls": size, "leaderboard": rolls[:10]})
+    github.seed("top_1000.json", {"leaderboard": rolls})
+
+
+def quantile(values, q):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def histogram_quantile(histogram, q):
+    # upper bound of the bucket the quantile falls in
+    target = q * histogram.count
+    seen = 0
+    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+        seen += count
+        if seen >= target and count:
+            return bound
+    return 0.0
+
+
+def merged_histograms(main, name):
+    merged = main.Histogram()
+    for (hist_name, _), h in main.metrics.histograms.items():
+        if hist_name == name:
+            merged.counts = [a + b for a, b in zip(merged.counts, h.counts)]
+            merged.sum += h.sum
+            merged.count += h.count
+    return merged
+
+
+def rss_kb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+async def drive(main, args, rng):
+    users = [FakeUser(10_000 + i) for i in range(args.users)]
+    guilds = [FakeGuild(1_000 + i) for i in range(args.guilds)]
+    channels = [FakeChannel(2_000 + i, args.send_latency) for i in range(args.guilds)]
+    content = f"!rng.goof roll {args.batch}" if args.batch > 1 else "!rng.goof"
+    latencies = []
+    remaining = args.messages
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            i = rng.randrange(len(guilds))
+            message = FakeMessage(rng.choice(users), guilds[i], channels[i], content)
+            start = time.perf_counter()
+            await main.on_message(message)
+            latencies.append(time.perf_counter() - start)
+            # each gateway message is its own task in discord.py; let the
+            # other workers, the writer and the outbox run in between
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    handled = time.perf_counter() - start
+    await main.outbox.close(timeout=60)
+    drained = time.perf_counter() - start
+    return sorted(latencies), handled, drained, sum(c.sent for c in channels)
+
+
+async def run_async(args):
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    github = FakeGitHub(args.latency, args.jitter, args.conflict_rate)
+    port = await github.start()
+    if args.top_1000:
+        seed_leaderboards(github, args.top_1000, rng)
+
+    data_dir = tempfile.mkdtemp(prefix="rng-goof-loadtest-")
+    os.environ.update({
+        "GITHUB_API_URL": f"http://127.0.0.1:{port}",
+        "GITHUB_REPO": "bench/rng-goof",
+        "GITHUB_TOKEN": "bench",
+        "STORAGE_BACKEND": args.backend,
+        "DATA_DIR": data_dir,
+        "SQLITE_PATH": os.path.join(data_dir, "rng_goof.db"),
+        "FLUSH_EVERY_ROLLS": str(args.flush_every),
+        "FLUSH_INTERVAL_SECONDS": str(args.flush_interval),
+        "ROLL_LEASE_SIZE": str(args.lease),
+        "PREFIX_COMMANDS": "1",
+        "SYNC_COMMANDS": "0"
+    })
+    import main
+
+    main.COOLDOWN_SECONDS = args.cooldown
+    main.limiter = main.RollLimiter()
+    await main.github.start()
+    load_start = time.perf_counter()
+    await main.state.load()
+    load_time = time.perf_counter() - load_start
+    main.state.start()
+
+    if args.trace_memory:
+        tracemalloc.start()
+    rss_before = rss_kb()
+    rolls_before = main.metrics.value("rng_goof_rolls_total")
+    latencies, handled, drained, sent = await drive(main, args, rng)
+    rolls = main.metrics.value("rng_goof_rolls_total") - rolls_before
+    rss_after = rss_kb()
+    traced = tracemalloc.get_traced_memory() if args.trace_memory else None
+
+    close_start = time.perf_counter()
+    await main.state.close()
+    close_time = time.perf_counter() - close_start
+    await main.github.close()
+    await github.close()
+
+    ms = 1000
+    print(f"{args.messages:,} messages, concurrency {args.concurrency}, {args.users:,} users, {args.guilds} guilds, "
+          f"backend {args.backend}, {args.top_1000:,} seeded 1000+ rolls")
+    print(f"load:        {load_time * ms:10.1f} ms")
+    print(f"handled:     {args.messages / handled:10,.0f} msgs/sec  ({handled:.2f}s)")
+    print(f"rolled:      {rolls / handled:10,.0f} rolls/sec ({rolls:,} rolls)")
+    throttled = {r: main.metrics.value("rng_goof_throttled_total", reason=r) for r in ("user", "guild", "global")}
+    print(f"throttled:   {throttled['user']:,} user / {throttled['guild']:,} guild / {throttled['global']:,} global")
+    print(f"handler:     p50 {quantile(latencies, 0.5) * ms:.3f} ms  p99 {quantile(latencies, 0.99) * ms:.3f} ms  "
+          f"max {latencies[-1] * ms if latencies else 0:.3f} ms")
+    wait = merged_histograms(main, "rng_goof_write_queue_wait_seconds")
+    print(f"queue wait:  p50 <= {histogram_quantile(wait, 0.5) * ms:g} ms  p99 <= {histogram_quantile(wait, 0.99) * ms:g} ms  "
+          f"({wait.count:,} saves)")
+    save = merged_histograms(main, "rng_goof_storage_save_seconds")
+    if save.count:
+        print(f"save:        mean {save.sum / save.count * ms:.1f} ms  p99 <= {histogram_quantile(save, 0.99) * ms:g} ms")
+    print(f"outbox:      {main.metrics.value('rng_goof_outbox_items_total'):,} replies in {sent:,} messages, "
+          f"drained {drained - handled:.2f}s after the last handler")
+    print(f"github:      {github.requests.get('GET', 0):,} GET / {github.requests.get('PUT', 0):,} PUT, "
+          f"{github.conflicts:,} conflicts (422), {github.bytes_written / 1024:,.0f} KiB written")
+    print(f"close:       {close_time * ms:10.1f} ms")
+    print(f"memory:      rss {rss_before / 1024:,.1f} -> {rss_after / 1024:,.1f} MiB")
+    if traced:
+        print(f"             traced {traced[0] / 1024 / 1024:,.1f} MiB now, {traced[1] / 1024 / 1024:,.1f} MiB peak")
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Load test on_message against a local GitHub stand-in")
+    parser.add_argument("-n", "--messages", type=int, default=20000)
+    parser.add_argument("-c", "--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=1, help="rolls per message (!rng.goof roll N)")
+    parser.add_argument("--cooldown", type=float, default=0, help="per-user cooldown seconds (the bot uses 2)")
+    parser.add_argument("--top-1000", type=int, default=0, help="seed top_1000.json with this many rolls")
+    parser.add_argument("--latency", type=float, default=0.02, help="GitHub API latency, seconds")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--conflict-rate", type=float, default=0.0)
+    parser.add_argument("--send-latency", type=float, default=0.0, help="Discord send latency, seconds")
+    parser.add_argument("--backend", choices=("github", "sqlite"), default="github")
+    parser.add_argument("--flush-every", type=int, default=25)
+    parser.add_argument("--flush-interval", type=int, default=60)
+    parser.add_argument("--lease", type=int, default=0, help="ROLL_LEASE_SIZE; 0 disables leases")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-memory", action="store_true", help="also track Python allocations (slower)")
+    asyncio.run(run_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    run()
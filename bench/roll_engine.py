@@ -0,0 +1,66 @@
+# Micro-benchmark: rolls/sec of the compiled RollEngine vs the old
+# per-call implementation of roll_item_once().
+#
+#   python bench/roll_engine.py [rolls]
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from main import rarities, modifiers, roll_item_once
+
+
+def legacy_roll_item_once():
+    items = list(rarities.items())
+    weights = [1.0 / v[0] for _, v in items]
+    total_weight = sum(weights)
+    r = random.random() * total_weight
+    acc = 0.0
+    selected_rarity, selected_chance = "Easy", rarities["Easy"][0]
+    for (name, (val, emoji)), w in zip(items, weights):
+        acc += w
+        if r <= acc:
+            selected_rarity = name
+            selected_chance = val
+            break
+
+    active_mods = []
+    for mod_name, (val, emoji) in modifiers.items():
+        if mod_name == "Normal":
+            continue
+        if random.random() < (1.0 / val):
+            active_mods.append(mod_name)
+
+    total_multiplier = 1
+    for mod in active_mods:
+        total_multiplier *= modifiers[mod][0]
+
+    total_rarity = int(selected_chance * total_multiplier)
+    emojis = [modifiers[m][1] for m in sorted(active_mods, key=lambda m: modifiers[m][0])]
+    emojis.append(rarities[selected_rarity][1])
+    emoji_string = " ".join(e for e in emojis if e)
+    text_string = " ".join(active_mods + [selected_rarity])
+    return f"{emoji_string} {text_string}".strip(), total_rarity
+
+
+def bench(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return n / (time.perf_counter() - start)
+
+
+def run():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    random.seed(0)
+    before = bench(legacy_roll_item_once, n)
+    after = bench(roll_item_once, n)
+    print(f"legacy roll_item_once: {before:>12,.0f} rolls/sec")
+    print(f"RollEngine:            {after:>12,.0f} rolls/sec")
+    print(f"speedup:               {after / before:>12.2f}x")
+
+
+if __name__ == "__main__":
+    run()
@@ -3,47 +3,262 @@ import random
 import os
 import asyncio
 from datetime import datetime
-from flask import Flask
-import threading
 import aiohttp
+from aiohttp import web
 import json
+from collections import OrderedDict
 import base64
+import sqlite3
+import math
+import time
+from bisect import bisect_left, bisect_right, insort
+from array import array
+import gzip
+import sys
+import zlib
 from random import randint
 from discord.ui import Button, View
+from discord import app_commands
+from typing import Literal
 
 # --- CONFIG ---
 DISCORD_TOKEN = os.getenv('DISCORD_BOT_TOKEN')
+# the old `!rng.goof ...` message commands; needs the message content intent
+PREFIX_COMMANDS = os.getenv("PREFIX_COMMANDS", "0") == "1"
+# push the slash command definitions to Discord on startup
+SYNC_COMMANDS = os.getenv("SYNC_COMMANDS", "1") == "1"
+WEB_PORT = int(os.getenv("PORT", "8080"))
 COOLDOWN_SECONDS = 2
+# extra roll limits, N rolls per window seconds; 0 disables them
+GUILD_RATE_LIMIT = int(os.getenv("GUILD_RATE_LIMIT", "0"))
+GUILD_RATE_WINDOW = float(os.getenv("GUILD_RATE_WINDOW", "10"))
+GLOBAL_RATE_LIMIT = int(os.getenv("GLOBAL_RATE_LIMIT", "0"))
+GLOBAL_RATE_WINDOW = float(os.getenv("GLOBAL_RATE_WINDOW", "1"))
+# outgoing replies: how long a channel's outbox collects a burst before
+# sending, and the most characters packed into one message (Discord caps 2000)
+OUTBOX_FLUSH_SECONDS = float(os.getenv("OUTBOX_FLUSH_SECONDS", "0.25"))
+OUTBOX_MAX_CHARS = min(2000, int(os.getenv("OUTBOX_MAX_CHARS", "2000")))
+# most rolls one `!rng.goof roll N` can ask for; a batch also costs N against
+# the guild/global limits above
+MAX_BATCH_ROLLS = int(os.getenv("MAX_BATCH_ROLLS", "100"))
+FLUSH_INTERVAL_SECONDS = int(os.getenv("FLUSH_INTERVAL_SECONDS", "60"))
+FLUSH_EVERY_ROLLS = int(os.getenv("FLUSH_EVERY_ROLLS", "25"))
+# local snapshot + roll journal
+DATA_DIR = os.getenv("DATA_DIR", "data")
+COMPACT_EVERY_ROLLS = int(os.getenv("COMPACT_EVERY_ROLLS", "500"))
+# the 1000+ board keeps this many of its rarest rolls in memory; the rest go
+# to compressed archive segments under DATA_DIR/archive
+LEADERBOARD_HOT_SIZE = int(os.getenv("LEADERBOARD_HOT_SIZE", "1000"))
+ARCHIVE_DIR = os.path.join(DATA_DIR, "archive")
+# "github" (journal + GitHub documents) or "sqlite"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "github")
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join(DATA_DIR, "rng_goof.db"))
+# keep the GitHub documents updated when STORAGE_BACKEND isn't github
+GITHUB_EXPORT = os.getenv("GITHUB_EXPORT", "1") == "1"
 
 # GitHub config
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 GITHUB_REPO = os.getenv("GITHUB_REPO")
+# overridable so bench/loadtest.py can point the bot at a local stand-in
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
 STATS_PATH = "stats.json"
 TOP_1000_PATH = "top_1000.json"
 ROLL_CHANNELS_PATH = "roll_channels.json"
+USERS_PATH = "users.json"
+USERS_DIR = "users"
+ROLL_LEASE_PATH = "roll_lease.json"
+TOP_1000_ARCHIVE_PATH = "top_1000_archive"
 GITHUB_HEADERS = {
     "Authorization": f"token {GITHUB_TOKEN}",
     "Accept": "application/vnd.github.v3+json"
 }
+GITHUB_POOL_SIZE = int(os.getenv("GITHUB_POOL_SIZE", "4"))
+GITHUB_TIMEOUT_SECONDS = float(os.getenv("GITHUB_TIMEOUT_SECONDS", "15"))
+GITHUB_MAX_RETRIES = int(os.getenv("GITHUB_MAX_RETRIES", "3"))
+GITHUB_MAX_BACKOFF_SECONDS = 30
+# how long a cached GitHub read may be served without revalidating (ETag)
+GITHUB_CACHE_MAX_AGE = float(os.getenv("GITHUB_CACHE_MAX_AGE", "30"))
+# how many times a save merges with another instance's write (422) and retries
+GITHUB_CONFLICT_RETRIES = int(os.getenv("GITHUB_CONFLICT_RETRIES", "3"))
+
+# Running several instances: each one leases ROLL_LEASE_SIZE roll numbers at a
+# time from roll_lease.json so roll numbers never collide; 0 (one instance)
+# just counts up from the highest roll number. Roll numbers are only names:
+# with leases they skip, so total rolls are counted per instance (roll_counts)
+# and summed. SHARD_COUNT/SHARD_IDS (comma separated)
+# pick the discord.py shards this process runs; unset runs them all.
+ROLL_LEASE_SIZE = int(os.getenv("ROLL_LEASE_SIZE", "0"))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0")) or None
+SHARD_IDS = [int(s) for s in os.getenv("SHARD_IDS", "").split(",") if s.strip()] or None
 
 # --- GLOBALS ---
-cooldowns = {}
-file_lock = asyncio.Lock()
 bot_id = randint(1,16777216)
 
-# --- FLASK KEEP-ALIVE ---
-app = Flask('')
+# --- METRICS ---
+# Counters and latency histograms, rendered in Prometheus text format on
+# /metrics. Recording is a dict lookup plus a bisect; rendering only happens
+# when something scrapes.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+class Metrics:
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def value(self, name, **labels):
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def histogram(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        return histogram
+
+    def observe(self, name, value, **labels):
+        self.histogram(name, **labels).observe(value)
+
+    def timer(self, name, **labels):
+        return Timer(self.histogram(name, **labels))
+
+    def gauge(self, name, fn):
+        self.gauges[name] = fn
+
+    def render(self):
+        lines = []
+        typed = set()
+
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        for (name, labels), value in sorted(list(self.counters.items())):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{fmt(labels)} {value}")
+        for (name, labels), h in sorted(list(self.histograms.items()), key=lambda item: item[0]):
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, count in zip(h.buckets + ("+Inf",), list(h.counts)):
+                cumulative += count
+                lines.append(f"{name}_bucket{fmt(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{fmt(labels)} {h.sum}")
+            lines.append(f"{name}_count{fmt(labels)} {h.count}")
+        for name, fn in sorted(list(self.gauges.items())):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {fn()}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+# --- WEB SERVER ---
+# Keep-alive, /metrics and a small read-only JSON API, served by aiohttp on the
+# bot's own event loop. Everything comes from the in-memory state; rendered
+# responses are cached until the next roll changes it (state.version).
+WEB_CACHE_SIZE = 256
+WEB_MAX_PAGE_SIZE = 100
+
+class WebServer:
+    def __init__(self):
+        self.app = web.Application()
+        self.app.router.add_get("/", self.home)
+        self.app.router.add_get("/metrics", self.prometheus_metrics)
+        self.app.router.add_get("/api/stats", self.api_stats)
+        self.app.router.add_get("/api/top", self.api_top)
+        self.app.router.add_get("/api/top_1000", self.api_top_1000)
+        self.runner = None
+        self.cache = OrderedDict()
+
+    async def start(self):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "0.0.0.0", WEB_PORT).start()
+
+    async def close(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    def cached_json(self, key, build):
+        if not state.ready.is_set():
+            return web.json_response({"error": "starting up"}, status=503)
+        hit = self.cache.get(key)
+        if hit is not None and hit[0] == state.version:
+            self.cache.move_to_end(key)
+            body = hit[1]
+        else:
+            body = json.dumps(build()).encode()
+            self.cache[key] = (state.version, body)
+            self.cache.move_to_end(key)
+            if len(self.cache) > WEB_CACHE_SIZE:
+                self.cache.popitem(last=False)
+        return web.Response(body=body, content_type="application/json")
+
+    async def home(self, request):
+        return web.Response(text="RNG GOOF bot is alive!")
 
-@app.route('/')
-def home():
-    return "RNG GOOF bot is alive!"
+    async def prometheus_metrics(self, request):
+        return web.Response(body=metrics.render().encode(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
 
-def run_web():
-    app.run(host='0.0.0.0', port=8080)
+    async def api_stats(self, request):
+        return self.cached_json("stats", lambda: {
+            "total_rolls": state.total_rolls,
+            "top_1000_entries": len(state.top_1000)
+        })
 
-def keep_alive():
-    t = threading.Thread(target=run_web)
-    t.start()
+    async def api_top(self, request):
+        return self.cached_json("top", lambda: {"leaderboard": state.top10.entries})
+
+    async def api_top_1000(self, request):
+        try:
+            page = max(1, int(request.query.get("page", "1")))
+            page_size = min(WEB_MAX_PAGE_SIZE, max(1, int(request.query.get("page_size", "10"))))
+        except ValueError:
+            return web.json_response({"error": "page and page_size must be integers"}, status=400)
+        if state.ready.is_set():
+            await state.top_1000.preload(page - 1, page_size)
+        return self.cached_json(("top_1000", page, page_size), lambda: {
+            "page": page,
+            "page_size": page_size,
+            "pages": state.top_1000.page_count(page_size),
+            "total": len(state.top_1000),
+            "leaderboard": state.top_1000.page(page - 1, page_size)
+        })
+
+web_server = WebServer()
 
 # --- RARITIES & MODIFIERS ---
 rarities = {
@@ -108,441 +323,2473 @@ modifiers = {
     "Mega": (1000000, "💯")
 }
 
-# --- GITHUB STATS FUNCTIONS ---
-async def load_stats():
-    url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{STATS_PATH}"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=GITHUB_HEADERS) as resp:
-            text = await resp.text()
+# --- GITHUB CLIENT ---
+# One long-lived session (keep-alive, bounded pool) shared by every GitHub call.
+# Retries timeouts/connection errors/5xx with exponential backoff, and waits out
+# primary (X-RateLimit-*) and secondary (Retry-After) rate limits.
+class GitHubClient:
+    def __init__(self):
+        self.session = None
+        self.blocked_until = 0
+        self.cache = {}
+
+    async def start(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                headers=GITHUB_HEADERS,
+                connector=aiohttp.TCPConnector(limit=GITHUB_POOL_SIZE, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=GITHUB_TIMEOUT_SECONDS)
+            )
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    def note_rate_limit(self, headers):
+        if headers.get("X-RateLimit-Remaining") == "0" and headers.get("X-RateLimit-Reset"):
+            self.blocked_until = int(headers["X-RateLimit-Reset"])
+
+    def rate_limit_delay(self, status, headers, backoff):
+        # None means this wasn't a rate limit (e.g. a genuine 403)
+        if headers.get("Retry-After") is not None:
+            return float(headers["Retry-After"])
+        if self.blocked_until > time.time():
+            return self.blocked_until - time.time()
+        if status == 429:
+            return backoff
+        return None
+
+    async def request(self, method, url, **kwargs):
+        await self.start()
+        for attempt in range(GITHUB_MAX_RETRIES + 1):
+            wait = self.blocked_until - time.time()
+            if wait > 0:
+                await asyncio.sleep(min(wait, GITHUB_MAX_BACKOFF_SECONDS))
+            last_attempt = attempt == GITHUB_MAX_RETRIES
+            backoff = min(GITHUB_MAX_BACKOFF_SECONDS, 0.5 * 2 ** attempt) * (0.5 + random.random())
             try:
-                data = json.loads(text)
-            except Exception as e:
-                return {"total_rolls": 0, "leaderboard": []}
-            if "message" in data and "content" not in data:
-                return {"total_rolls": 0, "leaderboard": []}
-            content = base64.b64decode(data["content"]).decode()
-            stats = json.loads(content)
-            stats.setdefault("total_rolls", 0)
-            stats.setdefault("leaderboard", [])
-            stats["_sha"] = data.get("sha", None)
-            return stats
-
-async def save_stats(stats, retry=1):
+                with metrics.timer("rng_goof_github_request_seconds", method=method):
+                    async with self.session.request(method, url, **kwargs) as resp:
+                        text = await resp.text()
+                        status = resp.status
+                        self.note_rate_limit(resp.headers)
+                        headers = resp.headers
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if last_attempt:
+                    raise
+                metrics.inc("rng_goof_github_retries_total", reason="error")
+                await asyncio.sleep(backoff)
+                continue
+
+            metrics.inc("rng_goof_github_responses_total", method=method, status=status)
+            if last_attempt:
+                return status, text, headers
+            if status >= 500:
+                metrics.inc("rng_goof_github_retries_total", reason="server_error")
+                await asyncio.sleep(backoff)
+                continue
+            if status in (403, 429):
+                delay = self.rate_limit_delay(status, headers, backoff)
+                if delay is not None:
+                    metrics.inc("rng_goof_github_retries_total", reason="rate_limit")
+                    await asyncio.sleep(min(delay, GITHUB_MAX_BACKOFF_SECONDS))
+                    continue
+            return status, text, headers
+
+    # Read-through cache for contents API GETs. Entries keep the decoded JSON
+    # with its sha/ETag; within max_age seconds they are served without a
+    # request, after that they are revalidated with If-None-Match so an
+    # unchanged file costs a 304 and no decoding or parsing.
+    async def get_contents(self, url, max_age=0):
+        entry = self.cache.get(url)
+        now = time.monotonic()
+        if entry and now - entry["fetched_at"] < max_age:
+            return copy_doc(entry["data"]), entry["sha"]
+        kwargs = {}
+        if entry and entry["etag"]:
+            kwargs["headers"] = {"If-None-Match": entry["etag"]}
+        status, text, headers = await self.request("GET", url, **kwargs)
+        if status == 304 and entry:
+            entry["fetched_at"] = now
+            return copy_doc(entry["data"]), entry["sha"]
+        try:
+            body = json.loads(text)
+        except Exception:
+            return None, None
+        if "message" in body and "content" not in body:
+            return None, None
+        try:
+            data = json.loads(base64.b64decode(body["content"]).decode())
+        except ValueError:
+            # files over 1 MB come back with empty content
+            print(f"Couldn't decode {url} ({body.get('size', '?')} bytes)")
+            return None, None
+        sha = body.get("sha")
+        self.cache[url] = {"etag": headers.get("ETag"), "sha": sha, "data": data, "fetched_at": now}
+        return copy_doc(data), sha
+
+    def cache_written(self, url, data, sha):
+        # what we just PUT is the current version; no ETag until the next GET
+        self.cache[url] = {"etag": None, "sha": sha, "data": copy_doc(data), "fetched_at": time.monotonic()}
+
+def copy_doc(data):
+    # callers mutate the top-level dict and its lists, never the entries in them
+    if isinstance(data, dict):
+        return {k: list(v) if isinstance(v, list) else v for k, v in data.items()}
+    return data
+
+github = GitHubClient()
+
+# --- GITHUB STATS FUNCTIONS ---
+async def load_stats(max_age=GITHUB_CACHE_MAX_AGE):
+    url = f"{GITHUB_API_URL}/repos/{GITHUB_REPO}/contents/{STATS_PATH}"
+    stats, sha = await github.get_contents(url, max_age)
+    if stats is None:
+        return {"total_rolls": 0, "roll_counts": {}, "last_roll": 0, "leaderboard": []}
+    stats.setdefault("total_rolls", 0)
+    stats["roll_counts"] = roll_counts(stats)
+    stats.setdefault("last_roll", stats["total_rolls"])
+    stats.setdefault("leaderboard", [])
+    stats["_sha"] = sha
+    return stats
+
+# instance -> rolls it made. Documents from before per-instance counts only
+# have total_rolls, which stays as a "base" count.
+def roll_counts(doc):
+    counts = doc.get("roll_counts")
+    return dict(counts) if counts else {"base": doc.get("total_rolls", 0)}
+
+# each instance only ever raises its own count, so the merge is a max per key
+def merge_counts(*counts):
+    merged = {}
+    for c in counts:
+        for instance, n in c.items():
+            merged[instance] = max(merged.get(instance, 0), n)
+    return merged
+
+async def save_stats(stats, retry=GITHUB_CONFLICT_RETRIES):
     sha = stats.pop('_sha', None)
-    url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{STATS_PATH}"
+    url = f"{GITHUB_API_URL}/repos/{GITHUB_REPO}/contents/{STATS_PATH}"
     payload = {
         "message": f"Update stats - total rolls {stats['total_rolls']}",
         "content": base64.b64encode(json.dumps(stats, indent=2).encode()).decode()
     }
     if sha:
         payload["sha"] = sha
-    async with aiohttp.ClientSession() as session:
-        async with session.put(url, headers=GITHUB_HEADERS, json=payload) as resp:
-            text = await resp.text()
-            status = resp.status
-            if status in (200, 201):
-                data = json.loads(text)
-                stats["_sha"] = data["content"]["sha"]
-                return True
-            if status == 422 and retry > 0:
-                new_stats = await load_stats()
-                new_stats.update({
-                    "total_rolls": stats["total_rolls"],
-                    "leaderboard": stats["leaderboard"]
-                })
-                return await save_stats(new_stats, retry - 1)
-            return False
+    status, text, _ = await github.request("PUT", url, json=payload)
+    if status in (200, 201):
+        data = json.loads(text)
+        github.cache_written(url, stats, data["content"]["sha"])
+        stats["_sha"] = data["content"]["sha"]
+        return True
+    if status == 422 and retry > 0:
+        metrics.inc("rng_goof_github_conflicts_total", document="stats")
+        # roll numbers are unique per instance, so merging is a union
+        new_stats = await load_stats(max_age=0)
+        counts = merge_counts(new_stats["roll_counts"], stats["roll_counts"])
+        new_stats.update({
+            "total_rolls": sum(counts.values()),
+            "roll_counts": counts,
+            "last_roll": max(new_stats["last_roll"], stats["last_roll"]),
+            "leaderboard": merge_rolls(new_stats["leaderboard"], stats["leaderboard"], capacity=10)
+        })
+        ok = await save_stats(new_stats, retry - 1)
+        stats.update(new_stats)
+        return ok
+    return False
 
 # --- GITHUB ROLL CHANNELS FUNCTIONS ---
-async def load_roll_channels():
-    url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{ROLL_CHANNELS_PATH}"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=GITHUB_HEADERS) as resp:
-            text = await resp.text()
-            try:
-                data = json.loads(text)
-            except Exception:
-                return {}
-            # if GitHub error
-            if "message" in data and "content" not in data:
-                return {}
-            content = base64.b64decode(data["content"]).decode()
-            roll_channels = json.loads(content)
-            roll_channels["_sha"] = data.get("sha", None)
-            return roll_channels
-
-async def save_roll_channels(roll_channels, retry=1):
+async def load_roll_channels(max_age=GITHUB_CACHE_MAX_AGE):
+    url = f"{GITHUB_API_URL}/repos/{GITHUB_REPO}/contents/{ROLL_CHANNELS_PATH}"
+    roll_channels, sha = await github.get_contents(url, max_age)
+    # if GitHub error
+    if roll_channels is None:
+        return {}
+    roll_channels["_sha"] = sha
+    return roll_channels
+
+async def save_roll_channels(roll_channels, retry=GITHUB_CONFLICT_RETRIES):
     sha = roll_channels.pop('_sha', None)
-    url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{ROLL_CHANNELS_PATH}"
+    url = f"{GITHUB_API_URL}/repos/{GITHUB_REPO}/contents/{ROLL_CHANNELS_PATH}"
     payload = {
         "message": "Update roll_channels mapping",
         "content": base64.b64encode(json.dumps(roll_channels, indent=2).encode()).decode()
     }
     if sha:
         payload["sha"] = sha
-    async with aiohttp.ClientSession() as session:
-        async with session.put(url, headers=GITHUB_HEADERS, json=payload) as resp:
-            text = await resp.text()
-            status = resp.status
-            if status in (200, 201):
-                data = json.loads(text)
-                roll_channels["_sha"] = data["content"]["sha"]
-                return True
-            if status == 422 and retry > 0:
-                new_channels = await load_roll_channels()
-                new_channels.update(roll_channels)
-                return await save_roll_channels(new_channels, retry - 1)
-            return False
-
-async def load_top_1000():
-    url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{TOP_1000_PATH}"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=GITHUB_HEADERS) as resp:
-            text = await resp.text()
-            try:
-                data = json.loads(text)
-            except Exception:
-                return {}
-            if "message" in data and "content" not in data:
-                return {}
-            content = base64.b64decode(data["content"]).decode()
-            top_1000 = json.loads(content)
-            top_1000["_sha"] = data.get("sha", None)
-            return top_1000
+    status, text, _ = await github.request("PUT", url, json=payload)
+    if status in (200, 201):
+        data = json.loads(text)
+        github.cache_written(url, roll_channels, data["content"]["sha"])
+        roll_channels["_sha"] = data["content"]["sha"]
+        return True
+    if status == 422 and retry > 0:
+        metrics.inc("rng_goof_github_conflicts_total", document="roll_channels")
+        new_channels = await load_roll_channels(max_age=0)
+        new_channels.update(roll_channels)
+        ok = await save_roll_channels(new_channels, retry - 1)
+        roll_channels.update(new_channels)
+        return ok
+    return False
+
+async def load_top_1000(max_age=GITHUB_CACHE_MAX_AGE):
+    url = f"{GITHUB_API_URL}/repos/{GITHUB_REPO}/contents/{TOP_1000_PATH}"
+    top_1000, sha = await github.get_contents(url, max_age)
+    if top_1000 is None:
+        return {}
+    top_1000["_sha"] = sha
+    return top_1000
 
 # --- HELPER FUNCTIONS FOR TOP_1000 LEADERBOARD ---
-async def save_top_1000(top_1000, retry=1):
+async def save_top_1000(top_1000, retry=GITHUB_CONFLICT_RETRIES):
     sha = top_1000.pop('_sha', None)
-    url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{TOP_1000_PATH}"
+    url = f"{GITHUB_API_URL}/repos/{GITHUB_REPO}/contents/{TOP_1000_PATH}"
     payload = {
         "message": "Update top_1000 leaderboard",
         "content": base64.b64encode(json.dumps(top_1000, indent=2).encode()).decode()
     }
     if sha:
         payload["sha"] = sha
-    async with aiohttp.ClientSession() as session:
-        async with session.put(url, headers=GITHUB_HEADERS, json=payload) as resp:
-            text = await resp.text()
-            status = resp.status
-            if status in (200, 201):
-                data = json.loads(text)
-                top_1000["_sha"] = data["content"]["sha"]
-                return True
-            if status == 422 and retry > 0:
-                new_top = await load_top_1000()
-                new_top.update(top_1000)
-                return await save_top_1000(new_top, retry - 1)
-            return False
-
-def update_top_1000_leaderboard(top_1000, roll_data):
-    if roll_data['rarity'] < 1000:
-        return
-    leaderboard = top_1000.get('leaderboard', [])
-    leaderboard.append(roll_data)
-    leaderboard.sort(key=lambda x: x['rarity'], reverse=True)
-    top_1000['leaderboard'] = leaderboard
-    
-# --- LEADERBOARD HELPERS ---
-def update_leaderboard(stats, roll_data):
-    leaderboard = stats.get('leaderboard', [])
-    leaderboard.append(roll_data)
-    leaderboard.sort(key=lambda x: x['rarity'], reverse=True)
-    rank = None
-    for i, roll in enumerate(leaderboard[:10], 1):
-        if roll == roll_data:
-            rank = i
-            break
-    stats['leaderboard'] = leaderboard[:10]
-    return rank
+    status, text, _ = await github.request("PUT", url, json=payload)
+    if status in (200, 201):
+        data = json.loads(text)
+        github.cache_written(url, top_1000, data["content"]["sha"])
+        top_1000["_sha"] = data["content"]["sha"]
+        return True
+    if status == 422 and retry > 0:
+        metrics.inc("rng_goof_github_conflicts_total", document="top_1000")
+        new_top = await load_top_1000(max_age=0)
+        new_top["leaderboard"] = merge_rolls(new_top.get("leaderboard", []), top_1000["leaderboard"])
+        index = new_top.get("archive", {})
+        for bucket, (count, parts) in top_1000.get("archive", {}).items():
+            theirs = index.get(bucket, (0, 0))
+            index[bucket] = [max(theirs[0], count), max(theirs[1], parts)]
+        new_top["archive"] = index
+        ok = await save_top_1000(new_top, retry - 1)
+        top_1000.update(new_top)
+        return ok
+    return False
+
+# --- GITHUB USER STATS FUNCTIONS ---
+# Per-user stats are split into USER_SHARDS documents (users/NN.json, by
+# user_id % USER_SHARDS) so a save only uploads the shards whose users rolled,
+# and no shard gets near the contents API's 1 MB limit. users.json is the
+# single document from before sharding; it's only read, and merged in.
+USER_SHARDS = 64
+
+def user_shard(user_id):
+    return int(user_id) % USER_SHARDS
+
+def users_url(shard):
+    if shard is None:
+        return f"{GITHUB_API_URL}/repos/{GITHUB_REPO}/contents/{USERS_PATH}"
+    return f"{GITHUB_API_URL}/repos/{GITHUB_REPO}/contents/{USERS_DIR}/{shard:02d}.json"
+
+async def load_users(shard, max_age=GITHUB_CACHE_MAX_AGE):
+    users, sha = await github.get_contents(users_url(shard), max_age)
+    if users is None:
+        return {}
+    users["_sha"] = sha
+    return users
+
+# -> packed users, {shard: sha}, whether the old users.json had anyone
+async def load_all_users():
+    shards = await asyncio.gather(*(load_users(shard) for shard in range(USER_SHARDS)))
+    legacy = await load_users(None)
+    legacy.pop("_sha", None)
+    github.cache.pop(users_url(None), None)
+    users = merge_users(legacy, *shards)
+    return users, {shard: doc.get("_sha") for shard, doc in enumerate(shards)}, bool(legacy)
+
+# per-user counters aren't additive across instances; keep whichever side has
+# seen more of that user's rolls
+def merge_users(*docs):
+    merged = {}
+    for doc in docs:
+        for user_id, record in doc.items():
+            if user_id != "_sha" and (user_id not in merged or record[0] >= merged[user_id][0]):
+                merged[user_id] = record
+    return merged
+
+async def save_users(shard, users, retry=GITHUB_CONFLICT_RETRIES):
+    sha = users.pop('_sha', None)
+    url = users_url(shard)
+    payload = {
+        "message": f"Update user stats shard {shard} - {len(users)} users",
+        "content": base64.b64encode(json.dumps(users, separators=(",", ":")).encode()).decode()
+    }
+    if sha:
+        payload["sha"] = sha
+    status, text, _ = await github.request("PUT", url, json=payload)
+    if status in (200, 201):
+        data = json.loads(text)
+        github.cache_written(url, users, data["content"]["sha"])
+        users["_sha"] = data["content"]["sha"]
+        return True
+    if status == 422 and retry > 0:
+        metrics.inc("rng_goof_github_conflicts_total", document="users")
+        current = await load_users(shard, max_age=0)
+        new_users = merge_users(current, users)
+        new_users["_sha"] = current.get("_sha")
+        ok = await save_users(shard, new_users, retry - 1)
+        users.update(new_users)
+        return ok
+    return False
+
+# --- GITHUB ARCHIVE FUNCTIONS ---
+# A rarity bucket is exported as parts of at most ARCHIVE_EXPORT_ROLLS rolls
+# (well under the contents API's 1 MB read limit): a roll goes in part
+# roll_number % parts, with parts a power of two, so a roll only changes its
+# own part and growing a bucket splits every part in two. Only changed parts
+# are uploaded, and they're not kept in the GitHub client's cache. Every
+# instance exports to the same paths, so a conflict is a union by roll number
+# like the other documents.
+ARCHIVE_EXPORT_ROLLS = 20000
+
+def archive_parts(count):
+    parts = 1
+    while parts * ARCHIVE_EXPORT_ROLLS < count:
+        parts *= 2
+    return parts
+
+def pack_segment(rolls):
+    rolls = sorted(rolls, key=roll_order)
+    data = zlib.compress(("[" + ",".join(json.dumps(r, separators=(",", ":"), ensure_ascii=False) for r in rolls) + "]").encode())
+    return {"count": len(rolls), "rolls": base64.b64encode(data).decode()}
+
+def unpack_segment(segment):
+    return json.loads(zlib.decompress(base64.b64decode(segment["rolls"])).decode())
+
+def unpack_segments(segments):
+    return [r for segment in segments for r in unpack_segment(segment)]
+
+# -> {part: segment} for the given parts of a bucket's sorted rolls
+def pack_parts(rolls, parts, wanted):
+    split = {part: [] for part in wanted}
+    for r in rolls:
+        if r[0] % parts in split:
+            split[r[0] % parts].append(r)
+    return {part: pack_segment(rs) for part, rs in split.items()}
+
+def merge_segments(*segments):
+    rolls = {}
+    for segment in segments:
+        for r in unpack_segment(segment):
+            rolls.setdefault(r[0], r)
+    return pack_segment(rolls.values())
+
+def archive_segment_url(bucket, part):
+    return f"{GITHUB_API_URL}/repos/{GITHUB_REPO}/contents/{TOP_1000_ARCHIVE_PATH}/{bucket:04d}-{part:03d}.json"
+
+async def load_archive_segment(bucket, part):
+    url = archive_segment_url(bucket, part)
+    segment, sha = await github.get_contents(url, 0)
+    github.cache.pop(url, None)
+    if segment is None:
+        return None
+    segment["_sha"] = sha
+    return segment
+
+async def save_archive_segment(bucket, part, segment, retry=GITHUB_CONFLICT_RETRIES):
+    sha = segment.pop('_sha', None)
+    url = archive_segment_url(bucket, part)
+    payload = {
+        "message": f"Update top_1000 archive segment {bucket}-{part} - {segment['count']} rolls",
+        "content": base64.b64encode(json.dumps(segment).encode()).decode()
+    }
+    if sha:
+        payload["sha"] = sha
+    status, text, _ = await github.request("PUT", url, json=payload)
+    if status in (200, 201):
+        segment["_sha"] = json.loads(text)["content"]["sha"]
+        return True
+    if status == 422 and retry > 0:
+        metrics.inc("rng_goof_github_conflicts_total", document="top_1000_archive")
+        current = await load_archive_segment(bucket, part)
+        new = merge_segments(current, segment) if current else dict(segment)
+        new["_sha"] = current.get("_sha") if current else None
+        ok = await save_archive_segment(bucket, part, new, retry - 1)
+        segment.update(new)
+        return ok
+    return False
+
+# --- GITHUB ROLL LEASES ---
+# roll_lease.json holds the next unleased roll number. An instance claims a
+# block with a compare-and-swap on the file's sha (a 422 means someone else
+# claimed first: re-read and try again) and hands numbers out from memory.
+# The next block is fetched in the background once a quarter of the current
+# one is left. Numbers left in a block when an instance stops are skipped.
+class RollLeases:
+    def __init__(self, size):
+        self.size = max(size, MAX_BATCH_ROLLS)
+        self.url = f"{GITHUB_API_URL}/repos/{GITHUB_REPO}/contents/{ROLL_LEASE_PATH}"
+        self.next = self.end = 0
+        self.spare = None
+        self.fetching = None
+
+    async def claim(self, floor):
+        try:
+            for _ in range(GITHUB_CONFLICT_RETRIES + 1):
+                lease, sha = await github.get_contents(self.url, 0)
+                start = max(lease["next_roll"] if lease else 0, floor)
+                doc = {"next_roll": start + self.size, "instance": bot_id}
+                payload = {
+                    "message": f"Lease rolls {start}-{start + self.size - 1} to instance {bot_id}",
+                    "content": base64.b64encode(json.dumps(doc).encode()).decode()
+                }
+                if sha:
+                    payload["sha"] = sha
+                status, text, _ = await github.request("PUT", self.url, json=payload)
+                if status in (200, 201):
+                    github.cache_written(self.url, doc, json.loads(text)["content"]["sha"])
+                    metrics.inc("rng_goof_roll_leases_total")
+                    return start, start + self.size
+                if status not in (409, 422):
+                    break
+                metrics.inc("rng_goof_github_conflicts_total", document="roll_lease")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            status = repr(e)
+        print(f"Failed to lease roll numbers: {status}")
+        return None
+
+    async def fetch(self, floor):
+        try:
+            self.spare = await self.claim(floor)
+            return self.spare is not None
+        finally:
+            self.fetching = None
+
+    def prefetch(self, floor):
+        if self.fetching is None and self.spare is None:
+            self.fetching = asyncio.create_task(self.fetch(floor))
+
+    # -> first of `count` consecutive roll numbers, or None if GitHub wouldn't
+    # give us a block
+    async def take(self, count, floor):
+        while self.end - self.next < count:
+            if self.spare is not None:
+                self.next, self.end = self.spare
+                self.spare = None
+                continue
+            self.prefetch(floor)
+            if not await asyncio.shield(self.fetching):
+                return None
+        start = self.next
+        self.next += count
+        if self.end - self.next < self.size // 4:
+            self.prefetch(floor)
+        return start
+
+# --- USER STATS ---
+# Per-user aggregates, updated in O(1) per roll. Tier and modifier counts are
+# keyed by name so they survive edits to the tables. Stored as compact lists:
+# [rolls, best rarity, best name, best roll number, {tier: n}, {modifier: n}]
+class UserStats:
+    __slots__ = ("rolls", "best_rarity", "best_name", "best_roll_number", "tiers", "modifiers")
+
+    def __init__(self, rolls=0, best_rarity=0, best_name="", best_roll_number=0, tiers=None, modifiers=None):
+        self.rolls = rolls
+        self.best_rarity = best_rarity
+        self.best_name = best_name
+        self.best_roll_number = best_roll_number
+        self.tiers = tiers if tiers is not None else {}
+        self.modifiers = modifiers if modifiers is not None else {}
+
+    def add(self, roll_data, tier, mods):
+        self.rolls += 1
+        if roll_data["rarity"] > self.best_rarity:
+            self.best_rarity = roll_data["rarity"]
+            self.best_name = roll_data["name"]
+            self.best_roll_number = roll_data["roll_number"]
+        if tier is not None:
+            self.tiers[tier] = self.tiers.get(tier, 0) + 1
+        for mod in mods or ():
+            self.modifiers[mod] = self.modifiers.get(mod, 0) + 1
+
+    def pack(self):
+        return [self.rolls, self.best_rarity, self.best_name, self.best_roll_number, self.tiers, self.modifiers]
+
+def pack_users(users):
+    return {str(user_id): stats.pack() for user_id, stats in users.items()}
+
+def unpack_users(packed):
+    return {int(user_id): UserStats(*record) for user_id, record in packed.items()}
+
+# --- LEADERBOARD ---
+# Entries are kept sorted by rarity (highest first) next to a parallel list of
+# -rarity keys, so inserts, rank lookups and percentiles are a bisect instead
+# of a re-sort/scan. Equal rarities keep insertion order, like the old
+# append + stable sort did.
+class Leaderboard:
+    def __init__(self, entries=(), capacity=None):
+        self.capacity = capacity
+        self.entries = sorted(entries, key=lambda x: x['rarity'], reverse=True)
+        if capacity is not None:
+            del self.entries[capacity:]
+        self.keys = [-e['rarity'] for e in self.entries]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def insert(self, roll_data):
+        key = -roll_data['rarity']
+        i = bisect_right(self.keys, key)
+        if self.capacity is not None and i >= self.capacity:
+            return None
+        self.keys.insert(i, key)
+        self.entries.insert(i, roll_data)
+        if self.capacity is not None and len(self.entries) > self.capacity:
+            self.keys.pop()
+            self.entries.pop()
+        return i + 1
+
+    def rank_of(self, rarity):
+        # number of entries at least this rare
+        return bisect_right(self.keys, -rarity)
+
+    def page_count(self, page_size=10):
+        return (len(self.entries) - 1) // page_size + 1 if self.entries else 0
+
+    def page(self, page, page_size=10):
+        start = page * page_size
+        return self.entries[start:start + page_size]
+
+    # adds another instance's entries that we haven't seen; -> how many
+    def merge(self, entries):
+        known = {e['roll_number'] for e in self.entries}
+        new = [e for e in entries if e['roll_number'] not in known]
+        if new:
+            self.__init__(merge_rolls(self.entries, new), self.capacity)
+        return len(new)
+
+def merge_rolls(*boards, capacity=None):
+    # union by roll number; equal rarities stay in roll order
+    rolls = {}
+    for entries in boards:
+        for e in entries:
+            rolls.setdefault(e['roll_number'], e)
+    return Leaderboard(sorted(rolls.values(), key=lambda e: e['roll_number']), capacity).entries
+
+# --- ROLL JOURNAL ---
+# Local persistence: a compact snapshot (snapshot.json) plus an append-only
+# log of every roll since that snapshot (rolls.jsonl, one JSON array per
+# line). A roll costs one short line; the snapshot is rewritten and the log
+# truncated every COMPACT_EVERY_ROLLS rolls. Loading is snapshot + replay of
+# the log tail. The log's first line names the snapshot generation it follows,
+# so a log left behind by a crash mid-checkpoint is ignored; roll numbers
+# can't tell (with leases they aren't monotonic). The GitHub documents are an
+# export of the same state.
+ROLL_FIELDS = ("roll_number", "rarity", "name", "user", "user_id", "server", "timestamp")
+
+def pack_roll(roll_data):
+    return [roll_data[f] for f in ROLL_FIELDS]
+
+def unpack_roll(record):
+    return dict(zip(ROLL_FIELDS, record))
+
+def make_snapshot(counts, last_roll, leaderboard, top_1000, roll_channels, shas=None, users=None, instance=None):
+    return {
+        "version": 1,
+        "total_rolls": sum(counts.values()),
+        "roll_counts": counts,
+        "last_roll": last_roll,
+        "instance": instance,
+        "leaderboard": [pack_roll(r) for r in leaderboard],
+        "top_1000": [pack_roll(r) for r in top_1000],
+        "roll_channels": roll_channels,
+        "users": pack_users(users or {}),
+        "shas": shas or {}
+    }
+
+class RollJournal:
+    def __init__(self, directory):
+        self.snapshot_path = os.path.join(directory, "snapshot.json")
+        self.log_path = os.path.join(directory, "rolls.jsonl")
+        self.directory = directory
+        self.log = None
+        self.generation = 0
+
+    def exists(self):
+        return os.path.exists(self.snapshot_path)
+
+    # -> snapshot, [(roll_data, tier, modifiers), ...] logged after it
+    def load(self):
+        with open(self.snapshot_path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+        self.generation = snapshot.get("generation", 0)
+        # snapshots from before generations: skip what they already counted
+        legacy_floor = None if "generation" in snapshot else snapshot["total_rolls"]
+        tail = []
+        if os.path.exists(self.log_path):
+            with open(self.log_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # torn write from a crash; everything before it is intact
+                        break
+                    if isinstance(record, dict):
+                        # header: the generation of the snapshot this log follows.
+                        # An older one means we crashed between writing the
+                        # snapshot and truncating the log.
+                        if record.get("generation") != self.generation:
+                            return snapshot, []
+                        continue
+                    roll_data = unpack_roll(record)
+                    if legacy_floor is not None and roll_data["roll_number"] <= legacy_floor:
+                        continue
+                    tier, mods = record[len(ROLL_FIELDS):] or (None, None)
+                    tail.append((roll_data, tier, mods))
+        return snapshot, tail
+
+    def open_log(self, mode):
+        os.makedirs(self.directory, exist_ok=True)
+        self.log = open(self.log_path, mode, encoding="utf-8")
+        if self.log.tell() == 0:
+            self.log.write(json.dumps({"generation": self.generation}) + "\n")
+
+    def append(self, rolls):
+        if self.log is None:
+            self.open_log("a")
+        self.log.write("".join(
+            json.dumps(pack_roll(roll_data) + [tier, mods], separators=(",", ":"), ensure_ascii=False) + "\n"
+            for roll_data, tier, mods in rolls
+        ))
+        self.log.flush()
+
+    def write_snapshot(self, snapshot):
+        os.makedirs(self.directory, exist_ok=True)
+        snapshot["generation"] = self.generation + 1
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, separators=(",", ":"), ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self.generation = snapshot["generation"]
+        # the snapshot covers everything logged so far
+        if self.log is not None:
+            self.log.close()
+        self.open_log("w")
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+# --- LEADERBOARD RETENTION ---
+# The 1000+ board is tiered. The rarest LEADERBOARD_HOT_SIZE rolls stay in
+# memory as RollRecords (slots, interned strings). Everything ranked below
+# them is spilled to the archive: rolls bucketed by rarity (ARCHIVE_BUCKETS
+# per doubling), each bucket a gzipped, sorted segment file plus a small
+# append-only log of newer rolls that the state writer folds in, in a worker
+# thread, once it reaches ARCHIVE_COMPACT_EVERY rolls. Only the rarities of archived rolls are kept in
+# memory (8 bytes each, so ranks stay exact); the rolls themselves are read
+# back, a few segments at a time and off the event loop, when someone pages
+# that deep.
+ARCHIVE_BUCKETS = 4
+ARCHIVE_COMPACT_EVERY = 1000
+ARCHIVE_CACHE_SEGMENTS = 8
+
+class RollRecord:
+    __slots__ = ROLL_FIELDS
+
+    def __init__(self, roll_number, rarity, name, user, user_id, server, timestamp):
+        self.roll_number = roll_number
+        self.rarity = rarity
+        self.name = sys.intern(name)
+        self.user = sys.intern(user)
+        self.user_id = user_id
+        self.server = sys.intern(server)
+        self.timestamp = timestamp
+
+    @classmethod
+    def from_dict(cls, roll_data):
+        if isinstance(roll_data, cls):
+            return roll_data
+        return cls(*pack_roll(roll_data))
+
+    def __getitem__(self, field):
+        return getattr(self, field)
+
+    def as_dict(self):
+        return {f: getattr(self, f) for f in ROLL_FIELDS}
+
+def archive_bucket(rarity):
+    return int(math.log2(rarity) * ARCHIVE_BUCKETS) if rarity > 0 else 0
+
+def roll_order(record):
+    return -record[1], record[0]
+
+class RollArchive:
+    def __init__(self, directory):
+        self.directory = directory
+        self.keys = {}
+        self.pending = {}
+        self.log_counts = {}
+        # bucket -> roll numbers added since it was last exported
+        self.unexported = {}
+        self.cache = OrderedDict()
+        # bucket -> segment read in progress, and the rolls added since it began
+        self.loading = {}
+        self.added = {}
+        # bucket -> compaction/restore rewriting its files in a worker thread
+        self.writing = {}
+        self.size = 0
+        # roll numbers already archived, only while the board is being loaded
+        self.seen = None
+
+    def __len__(self):
+        return self.size
+
+    def paths(self, bucket):
+        base = os.path.join(self.directory, f"{bucket:04d}")
+        return base + ".jsonl.gz", base + ".jsonl"
+
+    # packed rolls in a bucket's segment + log, the segment's part sorted. One
+    # roll per line, so a read in a worker thread never holds the GIL for long.
+    def read_files(self, bucket):
+        segment_path, log_path = self.paths(bucket)
+        rolls = []
+        if os.path.exists(segment_path):
+            with gzip.open(segment_path, "rt", encoding="utf-8") as f:
+                rolls = [json.loads(line) for line in f]
+        if os.path.exists(log_path):
+            with open(log_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rolls.append(json.loads(line))
+                    except ValueError:
+                        break
+        return rolls
+
+    def read(self, bucket):
+        return self.read_files(bucket) + self.pending.get(bucket, [])
+
+    def load(self):
+        self.keys, self.pending, self.log_counts, self.size = {}, {}, {}, 0
+        self.cache.clear()
+        self.seen = set()
+        if not os.path.isdir(self.directory):
+            return
+        buckets = {int(f.split(".")[0]) for f in os.listdir(self.directory) if f[:4].isdigit()}
+        for bucket in buckets:
+            rolls = self.read(bucket)
+            self.keys[bucket] = array("d", sorted(-r[1] for r in rolls))
+            self.seen.update(r[0] for r in rolls)
+            self.size += len(rolls)
+            segment_path, log_path = self.paths(bucket)
+            if os.path.exists(log_path):
+                with open(log_path, encoding="utf-8") as f:
+                    self.log_counts[bucket] = sum(1 for _ in f)
+
+    def add(self, roll_data):
+        if self.seen is not None:
+            if roll_data["roll_number"] in self.seen:
+                return
+            self.seen.add(roll_data["roll_number"])
+        bucket = archive_bucket(roll_data["rarity"])
+        insort(self.keys.setdefault(bucket, array("d")), -roll_data["rarity"])
+        record = pack_roll(roll_data)
+        self.pending.setdefault(bucket, []).append(record)
+        self.unexported.setdefault(bucket, set()).add(roll_data["roll_number"])
+        rolls = self.cache.get(bucket)
+        if rolls is not None:
+            insort(rolls, record, key=roll_order)
+        if bucket in self.added:
+            self.added[bucket].append(record)
+        self.size += 1
+
+    def count_at_least(self, rarity):
+        target = archive_bucket(rarity)
+        total = 0
+        for bucket, keys in self.keys.items():
+            if bucket > target:
+                total += len(keys)
+            elif bucket == target:
+                total += bisect_right(keys, -rarity)
+        return total
+
+    def cache_segment(self, bucket, rolls):
+        self.cache[bucket] = rolls
+        self.cache.move_to_end(bucket)
+        if len(self.cache) > ARCHIVE_CACHE_SEGMENTS:
+            self.cache.popitem(last=False)
+
+    # sorted rolls of one bucket, from the LRU of recently read segments. New
+    # rolls are inserted into a cached segment, so it stays valid.
+    def segment(self, bucket):
+        rolls = self.cache.get(bucket)
+        if rolls is None:
+            rolls = sorted(self.read(bucket), key=roll_order)
+            self.cache_segment(bucket, rolls)
+        else:
+            self.cache.move_to_end(bucket)
+        return rolls
+
+    # segment(), with the read and sort in a worker thread. Rolls added while
+    # it runs are collected in `added` and merged in afterwards, and the
+    # bucket isn't compacted until it's done.
+    async def fetch(self, bucket):
+        while bucket in self.writing:
+            await asyncio.wait([self.writing[bucket]])
+        rolls = self.cache.get(bucket)
+        if rolls is not None:
+            self.cache.move_to_end(bucket)
+            return rolls
+        if bucket not in self.loading:
+            self.loading[bucket] = asyncio.create_task(self.read_segment(bucket))
+        return await asyncio.shield(self.loading[bucket])
+
+    def read_sorted(self, bucket):
+        rolls = sorted(self.read_files(bucket), key=roll_order)
+        return rolls, {r[0] for r in rolls}
+
+    async def read_segment(self, bucket):
+        self.added[bucket] = list(self.pending.get(bucket, []))
+        try:
+            rolls, numbers = await asyncio.to_thread(self.read_sorted, bucket)
+            added = self.added[bucket]
+        finally:
+            del self.added[bucket], self.loading[bucket]
+        for record in added:
+            if record[0] not in numbers:
+                insort(rolls, record, key=roll_order)
+        self.cache_segment(bucket, rolls)
+        return rolls
+
+    # (bucket, offset, count) slices covering archive ranks start..start+count
+    def spans(self, start, count):
+        for bucket in sorted(self.keys, reverse=True):
+            size = len(self.keys[bucket])
+            if start >= size:
+                start -= size
+                continue
+            take = min(count, size - start)
+            yield bucket, start, take
+            count -= take
+            start = 0
+            if count <= 0:
+                return
+
+    async def preload(self, start, count):
+        for bucket, _, _ in list(self.spans(start, count)):
+            await self.fetch(bucket)
+
+    # `count` rolls starting at archive rank `start` (0-based), as dicts
+    def page(self, start, count):
+        rolls = []
+        for bucket, offset, take in self.spans(start, count):
+            rolls.extend(unpack_roll(r) for r in self.segment(bucket)[offset:offset + take])
+        return rolls
+
+    # appends pending rolls to the bucket logs; a bucket being rewritten keeps
+    # its rolls pending until that's done
+    def flush(self):
+        if not self.pending:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for bucket in [b for b in self.pending if b not in self.writing]:
+            rolls = self.pending.pop(bucket)
+            _, log_path = self.paths(bucket)
+            with open(log_path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(r, separators=(",", ":"), ensure_ascii=False) + "\n" for r in rolls))
+            self.log_counts[bucket] = self.log_counts.get(bucket, 0) + len(rolls)
+
+    # runs in a worker thread: folds the log and `extra` rolls (minus `skip`)
+    # into a new segment file; -> its sorted rolls
+    def rewrite_files(self, bucket, extra, skip):
+        rolls = {r[0]: r for r in self.read_files(bucket)}
+        for r in extra:
+            if r[0] not in skip:
+                rolls.setdefault(r[0], r)
+        rolls = sorted(rolls.values(), key=roll_order)
+        segment_path, log_path = self.paths(bucket)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = segment_path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            f.writelines(json.dumps(r, separators=(",", ":"), ensure_ascii=False) + "\n" for r in rolls)
+        os.replace(tmp_path, segment_path)
+        if os.path.exists(log_path):
+            os.remove(log_path)
+        return rolls
+
+    # one rewrite per bucket at a time, never while a read of it is running
+    async def rewrite(self, bucket, extra=(), skip=()):
+        while bucket in self.loading or bucket in self.writing:
+            await asyncio.wait([self.loading.get(bucket) or self.writing[bucket]])
+        task = self.writing[bucket] = asyncio.ensure_future(asyncio.to_thread(self.rewrite_files, bucket, extra, skip))
+        try:
+            rolls = await task
+        finally:
+            del self.writing[bucket]
+        self.log_counts[bucket] = 0
+        return rolls
+
+    # called from the state writer, off the roll path
+    async def compact_due(self):
+        for bucket in [b for b, n in self.log_counts.items() if n >= ARCHIVE_COMPACT_EVERY]:
+            await self.rewrite(bucket)
+
+    # bucket -> [rolls, exported parts]
+    def index(self):
+        return {str(bucket): [len(keys), archive_parts(len(keys))] for bucket, keys in sorted(self.keys.items())}
+
+    async def export(self, bucket, parts, wanted):
+        rolls = list(await self.fetch(bucket))
+        return await asyncio.to_thread(pack_parts, rolls, parts, wanted)
+
+    # adds the rolls of exported segments we don't have yet, except `skip`
+    # (roll numbers on the hot board); -> how many
+    async def restore(self, bucket, segments, skip=()):
+        extra = await asyncio.to_thread(unpack_segments, segments)
+        rolls = await self.rewrite(bucket, extra, skip)
+        numbers = {r[0] for r in rolls}
+        pending = [r for r in self.pending.get(bucket, []) if r[0] not in numbers]
+        if pending:
+            self.pending[bucket] = pending
+        else:
+            self.pending.pop(bucket, None)
+        before = len(self.keys.get(bucket, ()))
+        self.keys[bucket] = array("d", sorted(-r[1] for r in rolls + pending))
+        self.size += len(self.keys[bucket]) - before
+        self.cache.pop(bucket, None)
+        if self.seen is not None:
+            self.seen.update(numbers)
+        return len(self.keys[bucket]) - before
+
+class TieredLeaderboard:
+    def __init__(self, entries=(), archive=None, hot_size=LEADERBOARD_HOT_SIZE):
+        self.archive = archive
+        self.hot_size = hot_size
+        seen = archive.seen if archive is not None and archive.seen else ()
+        board = Leaderboard([RollRecord.from_dict(e) for e in entries if e['roll_number'] not in seen])
+        self.hot = board
+        if archive is not None and len(board) > hot_size:
+            for record in board.entries[hot_size:]:
+                archive.add(record)
+            self.hot = Leaderboard(board.entries[:hot_size])
+
+    def __len__(self):
+        return len(self.hot) + (len(self.archive) if self.archive is not None else 0)
+
+    @property
+    def entries(self):
+        return self.hot.entries
+
+    def insert(self, roll_data):
+        if self.archive is None or len(self.hot) < self.hot_size or roll_data['rarity'] > self.hot.entries[-1]['rarity']:
+            rank = self.hot.insert(RollRecord.from_dict(roll_data))
+            if self.archive is not None and len(self.hot) > self.hot_size:
+                self.hot.keys.pop()
+                self.archive.add(self.hot.entries.pop())
+            return rank
+        self.archive.add(roll_data)
+        return self.rank_of(roll_data['rarity'])
+
+    def rank_of(self, rarity):
+        rank = self.hot.rank_of(rarity)
+        if self.archive is not None:
+            rank += self.archive.count_at_least(rarity)
+        return rank
+
+    def page_count(self, page_size=10):
+        return (len(self) - 1) // page_size + 1 if len(self) else 0
+
+    # reads the archive segments a page needs without blocking the loop;
+    # call before page() for anything that may reach past the hot part
+    async def preload(self, page, page_size=10):
+        start = page * page_size
+        if self.archive is not None and start + page_size > len(self.hot):
+            await self.archive.preload(max(0, start - len(self.hot)), start + page_size - max(start, len(self.hot)))
+
+    def page(self, page, page_size=10):
+        start = page * page_size
+        rolls = [r.as_dict() for r in self.hot.entries[start:start + page_size]]
+        if len(rolls) < page_size and self.archive is not None:
+            rolls += self.archive.page(max(0, start - len(self.hot)), page_size - len(rolls))
+        return rolls
+
+    # another instance's hot entries; only the ones that would rank in our hot
+    # part are taken, anything below it lives in that instance's archive
+    def merge(self, entries):
+        known = {e['roll_number'] for e in self.hot.entries}
+        full = self.archive is not None and len(self.hot) >= self.hot_size
+        floor = self.hot.entries[-1]['rarity'] if full else 0
+        new = [e for e in entries if e['roll_number'] not in known and e['rarity'] > floor]
+        for e in sorted(new, key=lambda e: e['roll_number']):
+            self.insert(e)
+        return len(new)
+
+    def flush(self):
+        if self.archive is not None:
+            self.archive.flush()
+
+    async def compact(self):
+        if self.archive is not None:
+            await self.archive.compact_due()
+
+archive = RollArchive(ARCHIVE_DIR)
+
+# --- STORAGE BACKENDS ---
+# Every backend has the same shape:
+#   load()                -> (state dict or None if empty, rolls to replay)
+#   record_rolls(rolls)   inline for every roll or batch of
+#                         (roll_data, tier, modifiers), must be cheap
+#   save(name, state)     persist one of "stats"/"top_1000"/"roll_channels"
+#   checkpoint(state)     every COMPACT_EVERY_ROLLS rolls and on shutdown
+#   close()
+# STORAGE_BACKEND picks the primary one. With the sqlite backend GitHub can
+# still be kept up to date as an export target (GITHUB_EXPORT).
+
+# the GitHub contents API, with the local roll journal in front of it when
+# journal_dir is set (as primary backend; not as export target)
+class GitHubStorage:
+    def __init__(self, journal_dir=None):
+        self.journal = RollJournal(journal_dir) if journal_dir else None
+        self.shas = {}
+        # user shards changed since their last save; an export target has no
+        # journal to remember them by, so it starts with all of them
+        self.dirty_shards = set() if self.journal else set(range(USER_SHARDS))
+        # shard -> user ids in it, built on the first save
+        self.shard_users = None
+
+    async def load(self):
+        if self.journal is not None and self.journal.exists():
+            snapshot, tail = self.journal.load()
+            self.shas = snapshot.get("shas", {})
+            # snapshots from before sharding: every shard still needs its first save
+            self.dirty_shards = set(snapshot.get("dirty_shards", range(USER_SHARDS)))
+            self.dirty_shards.update(user_shard(roll_data["user_id"]) for roll_data, _, _ in tail)
+            return {
+                "roll_counts": roll_counts(snapshot),
+                "last_roll": snapshot.get("last_roll", snapshot["total_rolls"]),
+                "instance": snapshot.get("instance"),
+                "leaderboard": [unpack_roll(r) for r in snapshot["leaderboard"]],
+                "top_1000": [unpack_roll(r) for r in snapshot["top_1000"]],
+                "roll_channels": snapshot["roll_channels"],
+                "users": unpack_users(snapshot.get("users", {}))
+            }, tail
+        stats = await load_stats()
+        top_1000 = await load_top_1000()
+        roll_channels = await load_roll_channels()
+        users, user_shas, legacy = await load_all_users()
+        self.shas = {
+            "stats": stats.pop("_sha", None),
+            "top_1000": top_1000.pop("_sha", None),
+            "roll_channels": roll_channels.pop("_sha", None)
+        }
+        self.shas.update({f"users/{shard}": sha for shard, sha in user_shas.items()})
+        if legacy:
+            self.dirty_shards = set(range(USER_SHARDS))
+        await self.restore_archive(top_1000.get("archive", {}))
+        return {
+            "roll_counts": stats["roll_counts"],
+            "last_roll": stats["last_roll"],
+            "leaderboard": stats["leaderboard"],
+            "top_1000": top_1000.get("leaderboard", []),
+            "roll_channels": roll_channels,
+            "users": unpack_users(users)
+        }, []
+
+    # fetch the exported segments the local archive doesn't have (a fresh disk)
+    async def restore_archive(self, index):
+        for bucket, (count, parts) in index.items():
+            bucket = int(bucket)
+            if len(archive.keys.get(bucket, ())) >= count:
+                continue
+            segments = []
+            for part in range(parts):
+                segment = await load_archive_segment(bucket, part)
+                if segment is None:
+                    print(f"Archive segment {bucket}-{part} is missing or unreadable on GitHub")
+                    continue
+                self.shas[f"archive/{bucket}/{part}"] = segment.pop("_sha")
+                segments.append(segment)
+            if segments:
+                await archive.restore(bucket, segments)
+
+    def record_rolls(self, rolls):
+        for roll_data, _, _ in rolls:
+            shard = user_shard(roll_data["user_id"])
+            self.dirty_shards.add(shard)
+            if self.shard_users is not None:
+                self.shard_users[shard].add(roll_data["user_id"])
+        if self.journal is None:
+            return
+        try:
+            self.journal.append(rolls)
+        except OSError as e:
+            print(f"Failed to journal {len(rolls)} roll(s) from #{rolls[0][0]['roll_number']}: {e}")
+
+    def checkpoint(self, state):
+        if self.journal is None:
+            return
+        snapshot = make_snapshot(
+            state.roll_counts, state.last_roll, state.top10.entries, state.top_1000.entries,
+            state.roll_channels, self.shas, state.users, state.instance
+        )
+        snapshot["dirty_shards"] = sorted(self.dirty_shards)
+        try:
+            self.journal.write_snapshot(snapshot)
+        except OSError as e:
+            print(f"Failed to write snapshot: {e}")
+
+    def document(self, name, state):
+        if name == "stats":
+            doc = {
+                "total_rolls": state.total_rolls,
+                "roll_counts": dict(state.roll_counts),
+                "last_roll": state.last_roll,
+                "leaderboard": list(state.top10.entries)
+            }
+        elif name == "top_1000":
+            doc = {"leaderboard": [r.as_dict() for r in state.top_1000.entries], "archive": archive.index()}
+        else:
+            doc = dict(state.roll_channels)
+        doc["_sha"] = self.shas.get(name)
+        return doc
+
+    async def save(self, name, state):
+        if name == "users":
+            return await self.save_users(state)
+        savers = {"stats": save_stats, "top_1000": save_top_1000, "roll_channels": save_roll_channels}
+        # segments go first so the top_1000 index counts what they merged in
+        archived = await self.save_archive(state) if name == "top_1000" else True
+        doc = self.document(name, state)
+        saved = await savers[name](doc)
+        if saved:
+            self.shas[name] = doc.get("_sha")
+            state.absorb(name, doc)
+        return saved and archived
+
+    async def save_users(self, state):
+        if self.shard_users is None:
+            self.shard_users = [set() for _ in range(USER_SHARDS)]
+            for user_id in state.users:
+                self.shard_users[user_shard(user_id)].add(user_id)
+        shards, self.dirty_shards = sorted(self.dirty_shards), set()
+        ok = True
+        try:
+            while shards:
+                shard = shards[0]
+                key = f"users/{shard}"
+                doc = {str(user_id): state.users[user_id].pack() for user_id in self.shard_users[shard]}
+                doc["_sha"] = self.shas.get(key)
+                if await save_users(shard, doc):
+                    self.shas[key] = doc.get("_sha")
+                    state.absorb("users", doc)
+                    self.shard_users[shard].update(int(user_id) for user_id in doc if user_id != "_sha")
+                else:
+                    self.dirty_shards.add(shard)
+                    ok = False
+                shards.pop(0)
+        finally:
+            self.dirty_shards.update(shards)
+        return ok
+
+    async def save_archive(self, state):
+        changed, archive.unexported = archive.unexported, {}
+        buckets = sorted(changed)
+        hot = {r.roll_number for r in state.top_1000.entries}
+        ok = True
+        try:
+            while buckets:
+                bucket = buckets[0]
+                parts = archive_parts(len(archive.keys[bucket]))
+                if f"archive/{bucket}/{parts - 1}" in self.shas:
+                    wanted = {n % parts for n in changed[bucket]}
+                else:
+                    # new bucket, or it just split
+                    wanted = range(parts)
+                merged = []
+                for part, segment in (await archive.export(bucket, parts, wanted)).items():
+                    key = f"archive/{bucket}/{part}"
+                    count = segment["count"]
+                    segment["_sha"] = self.shas.get(key)
+                    if await save_archive_segment(bucket, part, segment):
+                        self.shas[key] = segment.pop("_sha")
+                        if segment["count"] > count:
+                            # took in another instance's rolls
+                            merged.append(segment)
+                    else:
+                        archive.unexported.setdefault(bucket, set()).update(changed[bucket])
+                        ok = False
+                if merged:
+                    await archive.restore(bucket, merged, hot)
+                buckets.pop(0)
+        finally:
+            # an exception leaves the rest for the next save
+            for bucket in buckets:
+                archive.unexported.setdefault(bucket, set()).update(changed[bucket])
+        return ok
+
+    async def close(self):
+        if self.journal is not None:
+            self.journal.close()
+
+# every roll (not just 1000+) in an indexed table. Rolls are buffered in
+# memory and written in one transaction per save, in a worker thread.
+class SQLiteStorage:
+    def __init__(self, path):
+        self.path = path
+        self.db = None
+        self.pending = []
+        self.dirty_users = set()
+
+    def connect(self):
+        if self.db is not None:
+            return self.db
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.db:
+            self.db.executescript("""
+                CREATE TABLE IF NOT EXISTS rolls (
+                    roll_number INTEGER PRIMARY KEY,
+                    rarity INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    user TEXT NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    server TEXT NOT NULL,
+                    timestamp INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS rolls_rarity ON rolls (rarity DESC, roll_number);
+                CREATE INDEX IF NOT EXISTS rolls_user_id ON rolls (user_id);
+                CREATE INDEX IF NOT EXISTS rolls_timestamp ON rolls (timestamp);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+                CREATE TABLE IF NOT EXISTS roll_counts (instance TEXT PRIMARY KEY, rolls INTEGER NOT NULL);
+                CREATE TABLE IF NOT EXISTS roll_channels (guild_id TEXT PRIMARY KEY, channel_id INTEGER NOT NULL);
+                CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, stats TEXT NOT NULL);
+            """)
+        return self.db
+
+    def read_all(self):
+        db = self.connect()
+        columns = ", ".join(ROLL_FIELDS)
+        meta = dict(db.execute("SELECT key, value FROM meta"))
+        if "total_rolls" not in meta and "last_roll" not in meta:
+            return None
+        counts = dict(db.execute("SELECT instance, rolls FROM roll_counts"))
+        return {
+            "roll_counts": counts or {"base": meta.get("total_rolls", 0)},
+            "last_roll": meta.get("last_roll", meta.get("total_rolls", 0)),
+            "instance": meta.get("instance"),
+            "leaderboard": [unpack_roll(r) for r in db.execute(
+                f"SELECT {columns} FROM rolls ORDER BY rarity DESC, roll_number LIMIT 10")],
+            "top_1000": [unpack_roll(r) for r in db.execute(
+                f"SELECT {columns} FROM rolls WHERE rarity >= 1000 ORDER BY rarity DESC, roll_number")],
+            "roll_channels": {guild: channel for guild, channel in db.execute("SELECT guild_id, channel_id FROM roll_channels")},
+            "users": {user_id: UserStats(*json.loads(stats)) for user_id, stats in db.execute("SELECT user_id, stats FROM users")}
+        }
+
+    async def load(self):
+        return await asyncio.to_thread(self.read_all), []
+
+    # meta: {"last_roll": n, "instance": id}
+    def write(self, rolls, meta=None, counts=None, roll_channels=None, users=None):
+        db = self.connect()
+        placeholders = ", ".join("?" for _ in ROLL_FIELDS)
+        with db:
+            if rolls:
+                db.executemany(f"INSERT OR IGNORE INTO rolls ({', '.join(ROLL_FIELDS)}) VALUES ({placeholders})", rolls)
+            if users:
+                db.executemany("INSERT OR REPLACE INTO users (user_id, stats) VALUES (?, ?)", users)
+            if meta:
+                db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", meta.items())
+            if counts:
+                db.executemany("INSERT OR REPLACE INTO roll_counts (instance, rolls) VALUES (?, ?)", counts.items())
+            if roll_channels is not None:
+                db.execute("DELETE FROM roll_channels")
+                db.executemany("INSERT INTO roll_channels (guild_id, channel_id) VALUES (?, ?)", roll_channels.items())
+
+    def seed(self, data):
+        rolls = {r["roll_number"]: pack_roll(r) for r in data["top_1000"] + data["leaderboard"]}
+        users = [(user_id, json.dumps(stats.pack())) for user_id, stats in data.get("users", {}).items()]
+        self.write(list(rolls.values()), {"last_roll": data["last_roll"]}, data["roll_counts"], data["roll_channels"], users)
+
+    def record_rolls(self, rolls):
+        for roll_data, tier, mods in rolls:
+            self.pending.append(pack_roll(roll_data))
+            self.dirty_users.add(roll_data["user_id"])
+
+    async def save(self, name, state):
+        rolls, self.pending = self.pending, []
+        dirty_users, self.dirty_users = self.dirty_users, set()
+        users = [(user_id, json.dumps(state.users[user_id].pack())) for user_id in dirty_users]
+        roll_channels = dict(state.roll_channels) if name == "roll_channels" else None
+        try:
+            meta = {"last_roll": state.last_roll, "instance": state.instance}
+            await asyncio.to_thread(self.write, rolls, meta, dict(state.roll_counts), roll_channels, users)
+        except Exception:
+            self.pending = rolls + self.pending
+            self.dirty_users |= dirty_users
+            raise
+        return True
+
+    def checkpoint(self, state):
+        pass
+
+    async def close(self):
+        if self.pending:
+            await asyncio.to_thread(self.write, self.pending)
+            self.pending = []
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+def make_storage(backend):
+    if backend == "sqlite":
+        return SQLiteStorage(SQLITE_PATH)
+    if backend == "github":
+        return GitHubStorage(DATA_DIR)
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}")
+
+# --- IN-MEMORY STATE ---
+# stats, top_1000 and roll_channels live here once on_ready has loaded them
+# from the storage backend. Rolls and reads only touch memory, and never await
+# while doing so, so they need no lock. Persistence is a separate ordered
+# pipeline: dirty documents are queued (every FLUSH_INTERVAL_SECONDS or after
+# FLUSH_EVERY_ROLLS rolls) and a single writer task saves them one at a time,
+# to the primary backend and then the export target, snapshotting each
+# document when it is actually written.
+class BotState:
+    def __init__(self):
+        # this process's key in roll_counts; kept across restarts by the
+        # local store
+        self.instance = bot_id
+        self.roll_counts = {}
+        self.last_roll = 0
+        self.top10 = Leaderboard(capacity=10)
+        self.top_1000 = TieredLeaderboard()
+        self.roll_channels = {}
+        self.users = {}
+        self.dirty = set()
+        self.dirty_rolls = 0
+        self.ready = asyncio.Event()
+        self.queue = asyncio.Queue()
+        self.queued = set()
+        self.writer_task = None
+        self.flush_loop_task = None
+        self.storage = make_storage(STORAGE_BACKEND)
+        self.export = GitHubStorage() if STORAGE_BACKEND != "github" and GITHUB_EXPORT else None
+        self.rolls_since_checkpoint = 0
+        self.version = 0
+        self.leases = RollLeases(ROLL_LEASE_SIZE) if ROLL_LEASE_SIZE > 0 else None
+
+    async def load(self):
+        await asyncio.to_thread(archive.load)
+        with metrics.timer("rng_goof_storage_load_seconds", backend=type(self.storage).__name__):
+            data, tail = await self.storage.load()
+        if data is None and self.export is not None:
+            # empty local store: start from what was last exported. A store
+            # with data doesn't need GitHub to start; the export picks up its
+            # shas from the 422 merge on its first save.
+            try:
+                data, _ = await self.export.load()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Couldn't load the GitHub export, starting empty: {e!r}")
+            else:
+                await asyncio.to_thread(self.storage.seed, data)
+        if data is not None:
+            self.roll_counts = data["roll_counts"]
+            self.last_roll = data["last_roll"]
+            self.instance = data.get("instance") or self.instance
+            self.top10 = Leaderboard(data["leaderboard"], capacity=10)
+            self.roll_channels = data["roll_channels"]
+            self.users = data.get("users", {})
+        # older snapshots and the sqlite table still list every 1000+ roll;
+        # whatever is already archived is skipped, the overflow spills
+        self.top_1000 = TieredLeaderboard(data["top_1000"] if data is not None else (), archive)
+        self.version += 1
+        for roll_data, tier, mods in tail:
+            self.apply_roll(roll_data, tier, mods)
+        archive.seen = None
+        self.checkpoint()
+        self.ready.set()
+
+    @property
+    def total_rolls(self):
+        return sum(self.roll_counts.values())
+
+    # returns the roll's rank on the top 10, or None
+    def apply_roll(self, roll_data, tier, mods):
+        self.version += 1
+        self.last_roll = max(self.last_roll, roll_data["roll_number"])
+        key = str(self.instance)
+        self.roll_counts[key] = self.roll_counts.get(key, 0) + 1
+        rank = self.top10.insert(roll_data)
+        self.mark_dirty("stats", "users")
+        user = self.users.get(roll_data["user_id"])
+        if user is None:
+            user = self.users[roll_data["user_id"]] = UserStats()
+        user.add(roll_data, tier, mods)
+        if roll_data["rarity"] >= 1000:
+            self.top_1000.insert(roll_data)
+            self.mark_dirty("top_1000")
+        return rank
+
+    # -> first of `count` roll numbers reserved for this instance, or None.
+    # Without leases this never suspends, so the caller's roll stays atomic.
+    async def claim_roll_numbers(self, count=1):
+        if self.leases is None:
+            return self.last_roll + 1
+        return await self.leases.take(count, self.last_roll + 1)
+
+    # picks up what other instances wrote when a save had to merge with them
+    def absorb(self, name, doc):
+        if name == "stats":
+            counts = merge_counts(self.roll_counts, doc["roll_counts"])
+            changed = self.top10.merge(doc["leaderboard"]) + (counts != self.roll_counts)
+            self.roll_counts = counts
+            self.last_roll = max(self.last_roll, doc["last_roll"])
+        elif name == "top_1000":
+            changed = self.top_1000.merge(doc.get("leaderboard", []))
+        elif name == "users":
+            changed = 0
+            for user_id, record in doc.items():
+                if user_id == "_sha":
+                    continue
+                user = self.users.get(int(user_id))
+                if user is None or record[0] > user.rolls:
+                    self.users[int(user_id)] = UserStats(*record)
+                    changed += 1
+        else:
+            changed = 0
+            for guild_id, channel_id in doc.items():
+                if guild_id != "_sha" and guild_id not in self.roll_channels:
+                    self.roll_channels[guild_id] = channel_id
+                    changed += 1
+        if changed:
+            self.version += 1
+
+    def record_roll(self, roll_data, tier, mods):
+        return self.record_rolls([(roll_data, tier, mods)])[0]
+
+    # a batch is applied, journaled and counted towards the next flush as one
+    # unit; returns each roll's top 10 rank at the time it was inserted
+    def record_rolls(self, rolls):
+        ranks = [self.apply_roll(roll_data, tier, mods) for roll_data, tier, mods in rolls]
+        self.storage.record_rolls(rolls)
+        if self.export is not None:
+            self.export.record_rolls(rolls)
+        self.rolls_since_checkpoint += len(rolls)
+        if self.rolls_since_checkpoint >= COMPACT_EVERY_ROLLS:
+            self.checkpoint()
+        self.note_roll(len(rolls))
+        return ranks
+
+    def checkpoint(self):
+        # archive first: a crash in between leaves duplicates, which load skips
+        try:
+            self.top_1000.flush()
+        except OSError as e:
+            print(f"Failed to write archive: {e}")
+        self.storage.checkpoint(self)
+        self.rolls_since_checkpoint = 0
+
+    def start(self):
+        if self.writer_task is None:
+            self.writer_task = asyncio.create_task(self.writer())
+        if self.flush_loop_task is None:
+            self.flush_loop_task = asyncio.create_task(self.flush_loop())
+
+    def mark_dirty(self, *names):
+        self.dirty.update(names)
+
+    def note_roll(self, count=1):
+        self.dirty_rolls += count
+        if self.dirty_rolls >= FLUSH_EVERY_ROLLS:
+            self.flush()
+
+    def flush(self):
+        # hand every dirty document to the writer; a document that is already
+        # queued is not queued twice, the writer snapshots the latest state
+        dirty, self.dirty = self.dirty, set()
+        self.dirty_rolls = 0
+        for name in dirty:
+            if name not in self.queued:
+                self.queued.add(name)
+                self.queue.put_nowait((name, None, time.perf_counter()))
+
+    async def save_now(self, name):
+        # for callers that need to report the outcome (e.g. setup)
+        self.dirty.discard(name)
+        done = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((name, done, time.perf_counter()))
+        return await done
+
+    async def save(self, name):
+        saved = True
+        for backend in (self.storage, self.export):
+            if backend is None:
+                continue
+            try:
+                with metrics.timer("rng_goof_storage_save_seconds", backend=type(backend).__name__, document=name):
+                    saved = await backend.save(name, self) and saved
+            except Exception as e:
+                print(f"Failed to save {name} to {type(backend).__name__}: {e}")
+                saved = False
+        return saved
+
+    async def writer(self):
+        while True:
+            name, done, enqueued_at = await self.queue.get()
+            metrics.observe("rng_goof_write_queue_wait_seconds", time.perf_counter() - enqueued_at)
+            if done is None:
+                self.queued.discard(name)
+            saved = await self.save(name)
+            if not saved:
+                self.dirty.add(name)
+            if done is not None and not done.done():
+                done.set_result(saved)
+            try:
+                await self.top_1000.compact()
+            except OSError as e:
+                print(f"Failed to compact archive: {e}")
+            self.queue.task_done()
+
+    async def flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL_SECONDS)
+            self.flush()
+
+    async def close(self):
+        if self.flush_loop_task:
+            self.flush_loop_task.cancel()
+            self.flush_loop_task = None
+        if self.writer_task:
+            self.flush()
+            await self.queue.join()
+            self.writer_task.cancel()
+            self.writer_task = None
+        if self.ready.is_set():
+            self.checkpoint()
+            await self.storage.close()
+
+state = BotState()
+
+metrics.gauge("rng_goof_total_rolls", lambda: state.total_rolls)
+metrics.gauge("rng_goof_top_1000_entries", lambda: len(state.top_1000))
+metrics.gauge("rng_goof_top_1000_archived", lambda: len(archive))
+metrics.gauge("rng_goof_write_queue_depth", lambda: state.queue.qsize())
+
+# --- COOLDOWNS & RATE LIMITS ---
+# Every entry in a store has the same lifetime, so keeping keys in the order
+# they were last touched (move_to_end) also keeps them in expiry order. Each
+# call pops at most SWEEP_LIMIT expired entries off the front, which bounds
+# memory to the users/guilds active in the last window at O(1) per call.
+SWEEP_LIMIT = 32
+
+class CooldownStore:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.last = OrderedDict()
+
+    def __len__(self):
+        return len(self.last)
+
+    def sweep(self, now):
+        for _ in range(SWEEP_LIMIT):
+            if not self.last:
+                return
+            key, last = next(iter(self.last.items()))
+            if now - last < self.seconds:
+                return
+            del self.last[key]
+
+    def ready(self, key, now):
+        last = self.last.get(key)
+        return last is None or now - last >= self.seconds
+
+    def touch(self, key, now):
+        self.last[key] = now
+        self.last.move_to_end(key)
+
+    def forget(self, key):
+        self.last.pop(key, None)
+
+# token bucket per key: up to `limit` rolls, refilled over `window` seconds.
+# A bucket untouched for a whole window is full again, so it can be dropped.
+class RateLimiter:
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.buckets = OrderedDict()
+
+    def __len__(self):
+        return len(self.buckets)
+
+    def sweep(self, now):
+        for _ in range(SWEEP_LIMIT):
+            if not self.buckets:
+                return
+            key, (tokens, updated) = next(iter(self.buckets.items()))
+            if now - updated < self.window:
+                return
+            del self.buckets[key]
+
+    def tokens(self, key, now):
+        tokens, updated = self.buckets.get(key, (self.limit, now))
+        return min(self.limit, tokens + (now - updated) * self.limit / self.window)
+
+    # how many rolls the bucket can pay for right now
+    def available(self, key, now):
+        if self.limit <= 0:
+            return math.inf
+        return int(self.tokens(key, now))
+
+    def touch(self, key, now, cost=1):
+        if self.limit <= 0:
+            return
+        self.buckets[key] = (self.tokens(key, now) - cost, now)
+        self.buckets.move_to_end(key)
+
+    def refund(self, key, now, cost=1):
+        if self.limit <= 0:
+            return
+        self.buckets[key] = (min(self.limit, self.tokens(key, now) + cost), now)
+
+class RollLimiter:
+    def __init__(self):
+        self.users = CooldownStore(COOLDOWN_SECONDS)
+        self.guilds = RateLimiter(GUILD_RATE_LIMIT, GUILD_RATE_WINDOW)
+        self.everyone = RateLimiter(GLOBAL_RATE_LIMIT, GLOBAL_RATE_WINDOW)
+
+    # -> (rolls allowed, None), or (0, which limit it hit). A batch is one
+    # command for the user cooldown but `rolls` for the buckets, and is cut
+    # down to what the guild and global buckets have left.
+    def check(self, user_id, guild_id, now, rolls=1):
+        self.users.sweep(now)
+        self.guilds.sweep(now)
+        guild_left = self.guilds.available(guild_id, now) if guild_id is not None else math.inf
+        if not self.users.ready(user_id, now):
+            reason = "user"
+        elif guild_left < 1:
+            reason = "guild"
+        elif self.everyone.available(None, now) < 1:
+            reason = "global"
+        else:
+            rolls = min(rolls, guild_left, self.everyone.available(None, now))
+            self.users.touch(user_id, now)
+            if guild_id is not None:
+                self.guilds.touch(guild_id, now, rolls)
+            self.everyone.touch(None, now, rolls)
+            return rolls, None
+        metrics.inc("rng_goof_throttled_total", reason=reason)
+        return 0, reason
+
+    # undoes a check() that let the roll(s) through but couldn't roll them
+    def refund(self, user_id, guild_id, now, rolls=1):
+        self.users.forget(user_id)
+        if guild_id is not None:
+            self.guilds.refund(guild_id, now, rolls)
+        self.everyone.refund(None, now, rolls)
+
+limiter = RollLimiter()
+
+metrics.gauge("rng_goof_cooldown_entries", lambda: len(limiter.users))
 
 # --- ITEM ROLL ---
+# The rarities/modifiers tables are compiled once into a RollEngine:
+# - the base rarity is drawn from a Walker/Vose alias table (one random() call)
+# - modifiers are independent 1-in-N flips; instead of flipping all of them we
+#   jump straight to the next modifier that hits by inverting the
+#   "no hit in modifiers i..j" probability, so a roll costs about one random()
+#   per hit plus one, instead of one per modifier.
+# Call reload_roll_tables() after editing rarities/modifiers at runtime.
+class RollEngine:
+    def __init__(self, rarities, modifiers):
+        self.tier_names = list(rarities)
+        self.tier_values = [v for v, _ in rarities.values()]
+        self.tier_emojis = [e for _, e in rarities.values()]
+        self.build_alias([1.0 / v for v in self.tier_values])
+
+        mods = [(name, val, emoji) for name, (val, emoji) in modifiers.items() if name != "Normal"]
+        self.mod_names = [name for name, _, _ in mods]
+        self.mod_values = [val for _, val, _ in mods]
+        self.mod_emojis = [emoji for _, _, emoji in mods]
+        # emojis are shown in ascending multiplier order, names in table order
+        by_value = sorted(range(len(mods)), key=lambda i: self.mod_values[i])
+        self.mod_emoji_rank = [0] * len(mods)
+        for rank, i in enumerate(by_value):
+            self.mod_emoji_rank[i] = rank
+        # no_hit_log[k] = -log P(none of modifiers 0..k-1 hit)
+        self.no_hit_log = [0.0]
+        for val in self.mod_values:
+            self.no_hit_log.append(self.no_hit_log[-1] - math.log1p(-1.0 / val))
+        self.no_hit_total = self.no_hit_log[-1]
+
+        self.plain_names = [self.describe(i, ())[0] for i in range(len(self.tier_names))]
+
+    def build_alias(self, weights):
+        n = len(weights)
+        total = sum(weights)
+        scaled = [w * n / total for w in weights]
+        self.alias_prob = [1.0] * n
+        self.alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.alias_prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        # whatever is left over is 1.0 up to rounding error
+        for i in small + large:
+            self.alias_prob[i] = 1.0
+
+    def roll_tier(self):
+        x = random.random() * len(self.alias)
+        i = int(x)
+        if x - i < self.alias_prob[i]:
+            return i
+        return self.alias[i]
+
+    def roll_modifiers(self):
+        hits = []
+        no_hit_log = self.no_hit_log
+        start = 0
+        while True:
+            target = no_hit_log[start] - math.log(1.0 - random.random())
+            if target >= self.no_hit_total:
+                return hits
+            j = bisect_right(no_hit_log, target) - 1
+            hits.append(j)
+            start = j + 1
+
+    def describe(self, tier, hits):
+        total_rarity = self.tier_values[tier]
+        for i in hits:
+            total_rarity *= self.mod_values[i]
+        emojis = [self.mod_emojis[i] for i in sorted(hits, key=self.mod_emoji_rank.__getitem__)]
+        emojis.append(self.tier_emojis[tier])
+        emoji_string = " ".join(e for e in emojis if e)
+        text_string = " ".join([self.mod_names[i] for i in hits] + [self.tier_names[tier]])
+        return f"{emoji_string} {text_string}".strip(), total_rarity
+
+    # -> display name, total rarity, tier name, names of the modifiers that hit
+    def roll_detailed(self):
+        tier = self.roll_tier()
+        hits = self.roll_modifiers()
+        if not hits:
+            return self.plain_names[tier], self.tier_values[tier], self.tier_names[tier], []
+        name, rarity = self.describe(tier, hits)
+        return name, rarity, self.tier_names[tier], [self.mod_names[i] for i in hits]
+
+    def roll(self):
+        name, rarity, _, _ = self.roll_detailed()
+        return name, rarity
+
+    def roll_many(self, n):
+        roll_detailed = self.roll_detailed
+        return [roll_detailed() for _ in range(n)]
+
+roll_engine = RollEngine(rarities, modifiers)
+
+def reload_roll_tables():
+    global roll_engine, odds
+    roll_engine = RollEngine(rarities, modifiers)
+    odds = OddsTable(roll_engine)
+
 def roll_item_once():
-    items = list(rarities.items())  # (name, (val, emoji))
-    weights = [1.0 / v[0] for _, v in items]
-    total_weight = sum(weights)
-    if total_weight <= 0:
-        selected_rarity = "Easy"
-        selected_chance = rarities["Easy"][0]
+    return roll_engine.roll()
+
+# --- ODDS ---
+# The exact distribution of total rarity implied by the tables. Every
+# multiplier is an integer, so the DP over modifiers keys on the exact
+# product: each modifier either hits (value x mult, p x 1/mult) or doesn't.
+# Branches less likely than ODDS_PRUNE are dropped (their combined mass is
+# kept in `pruned`, ~1e-11 with the current tables), then the result is
+# combined with the base tiers into a sorted list of rarities with
+# P(rarity >= value) next to it, so lookups are one bisect.
+ODDS_PRUNE = 1e-15
+
+class OddsTable:
+    def __init__(self, engine, prune=ODDS_PRUNE):
+        self.engine = engine
+        products = {1: 1.0}
+        self.pruned = 0.0
+        for mult in engine.mod_values:
+            hit = 1.0 / mult
+            step = {}
+            for value, p in products.items():
+                step[value] = step.get(value, 0.0) + p * (1.0 - hit)
+                p_hit = p * hit
+                if p_hit >= prune:
+                    step[value * mult] = step.get(value * mult, 0.0) + p_hit
+                else:
+                    self.pruned += p_hit
+            products = step
+
+        tier_weights = [1.0 / v for v in engine.tier_values]
+        total_weight = sum(tier_weights)
+        self.tier_p = [w / total_weight for w in tier_weights]
+        dist = {}
+        for tier_value, tier_p in zip(engine.tier_values, self.tier_p):
+            for value, p in products.items():
+                dist[tier_value * value] = dist.get(tier_value * value, 0.0) + p * tier_p
+
+        self.values = sorted(dist)
+        # tail[i] = P(rarity >= values[i]), summed from the rare end
+        self.tail = [0.0] * len(self.values)
+        running = 0.0
+        for i in range(len(self.values) - 1, -1, -1):
+            running += dist[self.values[i]]
+            self.tail[i] = running
+
+    def at_least(self, rarity):
+        i = bisect_left(self.values, rarity)
+        return self.tail[i] if i < len(self.tail) else 0.0
+
+    # P(exactly this tier and exactly these modifiers)
+    def combo(self, tier, mods):
+        p = self.tier_p[tier]
+        for i, mult in enumerate(self.engine.mod_values):
+            p *= 1.0 / mult if i in mods else 1.0 - 1.0 / mult
+        return p
+
+odds = OddsTable(roll_engine)
+
+def format_odds(p):
+    if p <= 0:
+        return "never (as far as the odds table goes)"
+    return f"1 in {1 / p:,.0f} ({p * 100:.3g}%)"
+
+# --- DISCORD SEND ---
+async def send(channel, *args, **kwargs):
+    with metrics.timer("rng_goof_stage_seconds", stage="send"):
+        return await channel.send(*args, **kwargs)
+
+# Text replies that nobody needs the sent message back for are posted to a
+# per-channel outbox instead of awaited in the handler. One worker per busy
+# channel waits OUTBOX_FLUSH_SECONDS for a burst to build up, then packs
+# everything pending into as few messages as fit in OUTBOX_MAX_CHARS; repeats
+# of the same notice become one line of mentions. When Discord rate limits a
+# channel it's the worker that sleeps, and the backlog shows up as
+# rng_goof_outbox_depth.
+class Outbox:
+    def __init__(self):
+        self.pending = {}
+        self.workers = {}
+        self.depth = 0
+
+    def post(self, channel, text, mention=None):
+        self.pending.setdefault(channel.id, []).append((text, mention))
+        self.depth += 1
+        if channel.id not in self.workers:
+            self.workers[channel.id] = asyncio.create_task(self.worker(channel))
+
+    # "nrn bozo @a", "nrn bozo @b" -> "nrn bozo @a @b"
+    @staticmethod
+    def render(items):
+        lines = []
+        notices = {}
+        for text, mention in items:
+            if mention is None:
+                lines.append((text, None))
+            elif text not in notices:
+                notices[text] = [mention]
+                lines.append((text, notices[text]))
+            elif mention not in notices[text]:
+                notices[text].append(mention)
+        return [text if mentions is None else f"{text} {' '.join(mentions)}" for text, mentions in lines]
+
+    @staticmethod
+    def pack(lines, limit=OUTBOX_MAX_CHARS):
+        chunks = []
+        current = ""
+        for line in lines:
+            while len(line) > limit:
+                if current:
+                    chunks.append(current)
+                    current = ""
+                chunks.append(line[:limit])
+                line = line[limit:]
+            if current and len(current) + 1 + len(line) > limit:
+                chunks.append(current)
+                current = ""
+            current = f"{current}\n{line}" if current else line
+        if current:
+            chunks.append(current)
+        return chunks
+
+    async def worker(self, channel):
+        try:
+            while self.pending.get(channel.id):
+                if OUTBOX_FLUSH_SECONDS > 0:
+                    await asyncio.sleep(OUTBOX_FLUSH_SECONDS)
+                items = self.pending.pop(channel.id)
+                self.depth -= len(items)
+                metrics.inc("rng_goof_outbox_items_total", len(items))
+                for chunk in self.pack(self.render(items)):
+                    try:
+                        await send(channel, chunk)
+                        metrics.inc("rng_goof_outbox_messages_total")
+                    except Exception as e:
+                        print(f"Failed to send to channel {channel.id}: {e}")
+        finally:
+            self.workers.pop(channel.id, None)
+
+    async def close(self, timeout=5):
+        if self.workers:
+            await asyncio.wait(list(self.workers.values()), timeout=timeout)
+
+outbox = Outbox()
+metrics.gauge("rng_goof_outbox_depth", lambda: outbox.depth)
+
+# --- USER STATS EMBED ---
+def count_lines(counts, order, emojis, limit=10):
+    names = [n for n in order if counts.get(n)]
+    lines = [f"{emojis[n]} {n}: {counts[n]:,}".strip() for n in names[:limit]]
+    if len(names) > limit:
+        lines.append(f"...and {len(names) - limit} more")
+    return "\n".join(lines) or "None yet"
+
+def user_stats_embed(name, user):
+    best = f"**{user.best_name.upper()}**" if user.best_rarity >= 1000 else user.best_name
+    embed = discord.Embed(
+        title=f"{name}'s RNG GOOF stats",
+        description=(
+            f"Total Rolls: {user.rolls:,}\n"
+            f"Best Roll: {best} (1 in {user.best_rarity:,}) / All-Time Roll #{user.best_roll_number:,}"
+        ),
+        color=discord.Color.gold()
+    )
+    # rarest first
+    tier_order = list(rarities)
+    mod_order = sorted(modifiers, key=lambda m: modifiers[m][0], reverse=True)
+    embed.add_field(name="Tiers", value=count_lines(user.tiers, tier_order, {n: e for n, (_, e) in rarities.items()}), inline=True)
+    embed.add_field(name="Modifiers", value=count_lines(user.modifiers, mod_order, {n: e for n, (_, e) in modifiers.items()}), inline=True)
+    return embed
+
+# --- ROLL DATA ---
+def make_roll_data(author, guild, name, rarity, roll_number, timestamp):
+    return {
+        'name': name,
+        'rarity': rarity,
+        'user': str(author),
+        'user_id': author.id,
+        'server': guild.name if guild else 'DM',
+        'timestamp': timestamp,
+        'roll_number': roll_number
+    }
+
+# --- BATCH ROLL SUMMARY ---
+def batch_summary(mention, rolls, ranks):
+    first, last = rolls[0][0]["roll_number"], rolls[-1][0]["roll_number"]
+    best = max(rolls, key=lambda r: r[0]["rarity"])[0]
+    best_name = f"**{best['name'].upper()}**" if best["rarity"] >= 1000 else best["name"]
+
+    tier_counts = {}
+    for _, tier, _ in rolls:
+        tier_counts[tier] = tier_counts.get(tier, 0) + 1
+    histogram = " ".join(
+        f"{(rarities[t][1] or t)}×{tier_counts[t]}" for t in rarities if t in tier_counts
+    )
+
+    lines = [
+        f"-# RNG GOOF / {mention} / {len(rolls)} rolls / All-Time Rolls #{first:,}-#{last:,}",
+        f"Best: {best_name} (1 in {best['rarity']:,}) / Roll #{best['roll_number']:,}",
+        histogram
+    ]
+    rare = sum(1 for r in rolls if r[0]["rarity"] >= 1000)
+    if rare:
+        lines.append(f"{rare} roll{'s' if rare != 1 else ''} with rarity ≥ 1,000")
+    # later rolls in the batch can push earlier ones back out of the top 10
+    if any(ranks):
+        placed = [
+            f"#{rank} (Roll #{entry['roll_number']:,})"
+            for rank, entry in enumerate(state.top10.entries, start=1)
+            if first <= entry["roll_number"] <= last
+        ]
+        if placed:
+            lines.append(f"**Good for {', '.join(placed)} on the RNG GOOF leaderboard**")
+    return "\n".join(lines)
+
+# --- LEADERBOARD VIEWS ---
+# Open leaderboards keep nothing in memory: the board and page live in each
+# button's custom_id (a DynamicItem), so a click is handled the same way after
+# a restart or by another instance. Pages are rendered from the current board
+# when asked for, and the last few are cached until the next roll
+# (state.version).
+LEADERBOARD_PAGE_SIZE = 10
+LEADERBOARD_CACHE_SIZE = 64
+LEADERBOARDS = ("top", "1000")
+leaderboard_pages = OrderedDict()
+
+def leaderboard_board(kind):
+    return state.top10 if kind == "top" else state.top_1000
+
+def leaderboard_embed(kind, page):
+    key = (kind, page)
+    hit = leaderboard_pages.get(key)
+    if hit is not None and hit[0] == state.version:
+        leaderboard_pages.move_to_end(key)
+        return hit[1]
+
+    board = leaderboard_board(kind)
+    if kind == "top":
+        title = "RNG GOOF TOP 10 LEADERBOARD"
+        footer_text = f"Total Rolls: {state.total_rolls:,}"
     else:
-        r = random.random() * total_weight
-        acc = 0.0
-        selected_rarity = None
-        selected_chance = None
-        for (name, (val, emoji)), w in zip(items, weights):
-            acc += w
-            if r <= acc:
-                selected_rarity = name
-                selected_chance = val
-                break
-        if selected_rarity is None:
-            selected_rarity, selected_chance = "Easy", rarities["Easy"][0]
-
-    active_mods = []
-    for mod_name, (val, emoji) in modifiers.items():
-        if mod_name == "Normal":
-            continue
-        if random.random() < (1.0 / val):
-            active_mods.append(mod_name)
-            
-    total_multiplier = 1
-    for mod in active_mods:
-        total_multiplier *= modifiers[mod][0]
-
-    total_rarity = int(selected_chance * total_multiplier)
-    emojis = [modifiers[m][1] for m in sorted(active_mods, key=lambda m: modifiers[m][0])]
-    emojis.append(rarities[selected_rarity][1])
-    emoji_string = " ".join(e for e in emojis if e)
-
-    text_parts = active_mods + [selected_rarity]
-    text_string = " ".join(text_parts)
-    display_name = f"{emoji_string} {text_string}".strip()
-
-    return display_name, total_rarity
+        title = "RNG GOOF 1000+ RARITY LEADERBOARD"
+        footer_text = ""
+    description = ""
+    for j, roll in enumerate(board.page(page, LEADERBOARD_PAGE_SIZE), start=page * LEADERBOARD_PAGE_SIZE + 1):
+        timestamp = int(roll['timestamp'])
+        roll_name = roll['name']
+        roll_rarity = int(roll['rarity'])
+        display_name = f"**{roll_name.upper()}**" if roll_rarity >= 1000 else roll_name
+        description += (
+            f"#{j} - {display_name} (1 in {roll_rarity:,})\n"
+            f"Rolled by {roll['user']} at <t:{timestamp}> in {roll['server']} / All-Time Roll #{roll['roll_number']:,}\n\n"
+        )
+    embed = discord.Embed(
+        title=title,
+        description=description,
+        color=discord.Color.gold()
+    )
+    embed.set_footer(text=f"{footer_text} | Page {page + 1}/{board.page_count(LEADERBOARD_PAGE_SIZE)}")
+
+    leaderboard_pages[key] = (state.version, embed)
+    leaderboard_pages.move_to_end(key)
+    if len(leaderboard_pages) > LEADERBOARD_CACHE_SIZE:
+        leaderboard_pages.popitem(last=False)
+    return embed
+
+LEADERBOARD_BUTTONS = {
+    "prev": ("⬅️ Prev", discord.ButtonStyle.primary),
+    "next": ("Next ➡️", discord.ButtonStyle.primary),
+    "page": ("Jump to Page", discord.ButtonStyle.secondary),
+    "rank": ("Jump to Rank", discord.ButtonStyle.secondary)
+}
+
+# prev/next carry the page they go to, page/rank the page they were clicked on
+class LeaderboardButton(discord.ui.DynamicItem[Button], template=r"rnggoof:lb:(?P<kind>top|1000):(?P<action>prev|next|page|rank):(?P<page>[0-9]+)"):
+    def __init__(self, kind, action, page):
+        label, style = LEADERBOARD_BUTTONS[action]
+        super().__init__(Button(label=label, style=style, custom_id=f"rnggoof:lb:{kind}:{action}:{page}"))
+        self.kind = kind
+        self.action = action
+        self.page = page
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(match["kind"], match["action"], int(match["page"]))
+
+    async def callback(self, interaction):
+        if self.action in ("page", "rank"):
+            await interaction.response.send_modal(LeaderboardJump(self.kind, self.action))
+        else:
+            await show_leaderboard_page(interaction, self.kind, self.page)
+
+def leaderboard_view(kind, page):
+    pages = leaderboard_board(kind).page_count(LEADERBOARD_PAGE_SIZE)
+    view = View(timeout=None)
+    view.add_item(LeaderboardButton(kind, "prev", (page - 1) % pages))
+    view.add_item(LeaderboardButton(kind, "next", (page + 1) % pages))
+    view.add_item(LeaderboardButton(kind, "page", page))
+    view.add_item(LeaderboardButton(kind, "rank", page))
+    return view
+
+async def show_leaderboard_page(interaction, kind, page):
+    pages = leaderboard_board(kind).page_count(LEADERBOARD_PAGE_SIZE)
+    if not pages:
+        await interaction.response.send_message("No rolls yet 😔", ephemeral=True)
+        return
+    # the board may have shrunk since the buttons were drawn
+    page = min(page, pages - 1)
+    if kind == "1000":
+        await state.top_1000.preload(page, LEADERBOARD_PAGE_SIZE)
+    await interaction.response.edit_message(embed=leaderboard_embed(kind, page), view=leaderboard_view(kind, page))
+
+class LeaderboardJump(discord.ui.Modal):
+    def __init__(self, kind, target):
+        super().__init__(title="Jump to Page" if target == "page" else "Jump to Rank", timeout=120)
+        self.kind = kind
+        self.target = target
+        self.number = discord.ui.TextInput(label="Page number" if target == "page" else "Rank number (#)", max_length=9)
+        self.add_item(self.number)
+
+    async def on_submit(self, interaction):
+        board = leaderboard_board(self.kind)
+        value = self.number.value.strip().lstrip("#")
+        number = int(value) if value.isdigit() else 0
+        if self.target == "page":
+            if not 1 <= number <= board.page_count(LEADERBOARD_PAGE_SIZE):
+                await interaction.response.send_message("Invalid page number.", ephemeral=True)
+                return
+            await show_leaderboard_page(interaction, self.kind, number - 1)
+        else:
+            if not 1 <= number <= len(board):
+                await interaction.response.send_message("Invalid rank number.", ephemeral=True)
+                return
+            page = (number - 1) // LEADERBOARD_PAGE_SIZE
+            await show_leaderboard_page(interaction, self.kind, page)
+            await interaction.followup.send(f"Jumped to rank #{number} (page {page + 1}).", ephemeral=True)
+
+# --- COMMANDS ---
+# Shared by the slash commands and the prefix compatibility mode. They return
+# what to say and leave sending it to the caller.
+def help_text():
+    text = (
+        "**RNG GOOF Bot Commands:**\n"
+        "\n"
+        "`/roll` - Roll an item.\n"
+        f"`/roll count:<n>` - Roll up to {MAX_BATCH_ROLLS} items at once.\n"
+        "`/leaderboard top` - Show the top 10 all-time rolls.\n"
+        "`/leaderboard 1000` - Show top 10 rolls with rarity ≥ 1,000.\n"
+        "`/stats [user]` - Show roll stats for you or someone else.\n"
+        "`/odds <rarity|name>` - Show the exact odds of a rarity or an item.\n"
+        "`/setup` - Set this channel as the roll channel.\n"
+        "`/help` - Show this message."
+    )
+    if PREFIX_COMMANDS:
+        text += (
+            "\n\n"
+            "`!rng.goof` or `!rng.goof <anything>` still rolls, and `!rng.goof setup`, "
+            "`leaderboard top|1000`, `me`, `user @someone`, `roll <n>`, `odds <rarity|name>` and `help` still work."
+        )
+    return text
+
+async def setup_command(guild, channel, member):
+    if guild is None:
+        return "You can only use this command in a server."
+    perms = member.guild_permissions
+    if not (perms.manage_channels or perms.administrator):
+        return None
+    await state.ready.wait()
+    state.roll_channels[str(guild.id)] = channel.id
+    state.checkpoint()
+    if await state.save_now("roll_channels"):
+        return f"This channel ({channel.mention}) is now the roll channel!"
+    return "Failed to save roll channel to GitHub."
+
+# -> (reply, notice): the roll result for everyone, or a throttle/error line
+# for the roller only
+async def roll_command(author, guild, channel_id, count=1):
+    await state.ready.wait()
+    if guild is not None:
+        roll_channel = state.roll_channels.get(str(guild.id))
+        if roll_channel and roll_channel != channel_id:
+            return None, f"rolls go in <#{roll_channel}>"
+
+    now = asyncio.get_running_loop().time()
+    requested = count
+    count, throttled = limiter.check(author.id, guild.id if guild else None, now, count)
+    if throttled == "user":
+        return None, "nrn bozo"
+    if throttled:
+        return None, "too many rolls right now, try again in a sec"
+
+    first = await state.claim_roll_numbers(count)
+    if first is None:
+        limiter.refund(author.id, guild.id if guild else None, asyncio.get_running_loop().time(), count)
+        return None, "couldn't reserve roll numbers, try again in a sec"
+    # Nothing below awaits, so the leaderboard updates can't interleave with
+    # another roll.
+    timestamp_unix = int(datetime.utcnow().timestamp())
+    if requested > 1:
+        with metrics.timer("rng_goof_stage_seconds", stage="roll"):
+            results = roll_engine.roll_many(count)
+        rolls = [
+            (make_roll_data(author, guild, name, rarity, first + i, timestamp_unix), tier, mods)
+            for i, (name, rarity, tier, mods) in enumerate(results)
+        ]
+        ranks = state.record_rolls(rolls)
+        metrics.inc("rng_goof_rolls_total", count)
+        summary = batch_summary(author.mention, rolls, ranks)
+        if count < requested:
+            summary += f"\n-# only {count} of {requested} rolls fit under the rate limit right now"
+        return summary, None
+
+    with metrics.timer("rng_goof_stage_seconds", stage="roll"):
+        name, rarity, tier, mods = roll_engine.roll_detailed()
+    roll_number = first
+    roll_data = make_roll_data(author, guild, name, rarity, roll_number, timestamp_unix)
+    rank = state.record_roll(roll_data, tier, mods)
+    metrics.inc("rng_goof_rolls_total")
+
+    response_percentile = ""
+    if rarity >= 1000:
+        response_percentile = (
+            f"\n-# This roll is good for top {odds.at_least(rarity) * 100:.3g}% of all rolls"
+            f" (#{state.top_1000.rank_of(rarity):,} of {len(state.top_1000):,} 1000+ rarity rolls so far)"
+        )
+
+    display_name = f"**{name.upper()}**" if rarity >= 1000 else name
+    response = f'-# RNG GOOF / <@{author.id}> / All-Time Roll #{roll_number:,}\n{display_name} (1 in {rarity:,})'
+    if rank:
+        response += f'\n**This roll is good for #{rank} on the RNG GOOF leaderboard**'
+
+    response += response_percentile
+    return response, None
+
+def odds_command(query):
+    query = query.strip().replace("*", "")
+    if not query:
+        return "Usage: `odds <rarity>` or `odds <item name>`, e.g. `odds 50000` or `odds Hot Floral Medium`"
+    number = query.lower().removeprefix("1 in").strip().replace(",", "")
+    try:
+        rarity = float(number)
+    except ValueError:
+        rarity = None
+    if rarity is not None:
+        if rarity <= 0:
+            return "Rarity has to be positive."
+        return f"Rolls at least 1 in {rarity:,.0f} rare: {format_odds(odds.at_least(rarity))}"
+
+    engine = odds.engine
+    tier_index = {name.lower(): i for i, name in enumerate(engine.tier_names)}
+    mod_index = {name.lower(): i for i, name in enumerate(engine.mod_names)}
+    tiers, mods, unknown = [], set(), []
+    # pasted roll replies include custom emojis and plain emojis; skip them
+    for word in query.split():
+        key = word.lower()
+        if key in tier_index:
+            tiers.append(tier_index[key])
+        elif key in mod_index:
+            mods.add(mod_index[key])
+        elif not word.startswith("<") and any(c.isalnum() for c in word):
+            unknown.append(word)
+    if unknown:
+        return f"Don't know {', '.join(f'`{w}`' for w in unknown)}. Use tier and modifier names, or a number."
+    if len(tiers) > 1:
+        return "An item only has one tier."
+
+    multiplier = 1
+    for i in mods:
+        multiplier *= engine.mod_values[i]
+    if not tiers:
+        names = " ".join(engine.mod_names[i] for i in sorted(mods))
+        return f"**{names}** (x{multiplier:,}) hits {format_odds(1.0 / multiplier)}"
+
+    name, rarity = engine.describe(tiers[0], sorted(mods))
+    display_name = f"**{name.upper()}**" if rarity >= 1000 else name
+    return (
+        f"{display_name} (1 in {rarity:,})\n"
+        f"Exactly this item: {format_odds(odds.combo(tiers[0], mods))}\n"
+        f"At least this rare: {format_odds(odds.at_least(rarity))}"
+    )
+
+# -> text or embed for the user stats reply
+async def stats_command(target_id, target_name):
+    await state.ready.wait()
+    user = state.users.get(target_id)
+    if user is None:
+        return f"No rolls recorded for {target_name} yet 😔"
+    return user_stats_embed(target_name, user)
+
+async def leaderboard_command(kind, reply):
+    await state.ready.wait()
+    if kind not in LEADERBOARDS:
+        return "Unknown leaderboard type. Use `top` or `1000`."
+    if not len(leaderboard_board(kind)):
+        return "No rolls yet 😔"
+    if kind == "1000":
+        await reply(embed=leaderboard_embed(kind, 0), view=leaderboard_view(kind, 0))
+    else:
+        await reply(embed=leaderboard_embed(kind, 0))
+    return None
 
 # --- DISCORD BOT ---
+# Slash commands by default: without PREFIX_COMMANDS the bot doesn't ask for
+# message events at all, so other chatter never reaches it.
 intents = discord.Intents.default()
-intents.message_content = True
-client = discord.Client(intents=intents)
+intents.message_content = PREFIX_COMMANDS
+intents.messages = PREFIX_COMMANDS
+
+class RNGGoofClient(discord.AutoShardedClient):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.tree = app_commands.CommandTree(self)
+
+    async def setup_hook(self):
+        await github.start()
+        await web_server.start()
+        self.add_dynamic_items(LeaderboardButton)
+        if SYNC_COMMANDS:
+            await self.tree.sync()
+
+    async def close(self):
+        # flush anything still buffered before the connection goes away
+        await outbox.close()
+        await state.close()
+        await github.close()
+        await web_server.close()
+        await super().close()
+
+client = RNGGoofClient(intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
 
 @client.event
 async def on_ready():
     print(f'{client.user} has connected to Discord!')
+    if not state.ready.is_set():
+        await state.load()
+        state.start()
 
-@client.event
+# --- SLASH COMMANDS ---
+async def respond(interaction, *args, **kwargs):
+    with metrics.timer("rng_goof_stage_seconds", stage="send"):
+        if interaction.response.is_done():
+            return await interaction.followup.send(*args, wait=True, **kwargs)
+        await interaction.response.send_message(*args, **kwargs)
+
+# interactions must be answered within 3 seconds; right after startup the
+# state may still be loading
+async def defer_until_ready(interaction, ephemeral=False):
+    if not state.ready.is_set():
+        await interaction.response.defer(ephemeral=ephemeral)
+
+@client.tree.command(name="roll", description="Roll an item")
+@app_commands.describe(count=f"How many items to roll at once (up to {MAX_BATCH_ROLLS})")
+async def roll_slash(interaction: discord.Interaction, count: app_commands.Range[int, 1, max(1, MAX_BATCH_ROLLS)] = 1):
+    # claiming roll numbers can wait on GitHub, not just on startup
+    await interaction.response.defer()
+    reply, notice = await roll_command(interaction.user, interaction.guild, interaction.channel_id, count)
+    if notice:
+        await respond(interaction, notice, ephemeral=True)
+    else:
+        await respond(interaction, reply)
+
+@client.tree.command(name="leaderboard", description="Show the RNG GOOF leaderboards")
+@app_commands.describe(board="top: the top 10 all-time rolls, 1000: every roll with rarity ≥ 1,000")
+async def leaderboard_slash(interaction: discord.Interaction, board: Literal["top", "1000"]):
+    await defer_until_ready(interaction)
+
+    async def reply(**kwargs):
+        await respond(interaction, **kwargs)
+
+    error = await leaderboard_command(board, reply)
+    if error:
+        await respond(interaction, error, ephemeral=True)
+
+@client.tree.command(name="stats", description="Show roll stats for you or someone else")
+async def stats_slash(interaction: discord.Interaction, user: discord.User = None):
+    target = user or interaction.user
+    await defer_until_ready(interaction)
+    result = await stats_command(target.id, target.display_name)
+    if isinstance(result, str):
+        await respond(interaction, result)
+    else:
+        await respond(interaction, embed=result)
+
+@client.tree.command(name="odds", description="Show the exact odds of a rarity or an item")
+@app_commands.describe(query="A rarity like 50000, or an item like Hot Floral Medium")
+async def odds_slash(interaction: discord.Interaction, query: str):
+    await respond(interaction, odds_command(query))
+
+@client.tree.command(name="setup", description="Set this channel as the roll channel")
+@app_commands.guild_only()
+@app_commands.default_permissions(manage_channels=True)
+async def setup_slash(interaction: discord.Interaction):
+    # saving to GitHub can take longer than the interaction allows
+    await interaction.response.defer()
+    text = await setup_command(interaction.guild, interaction.channel, interaction.user)
+    await respond(interaction, text or "You need Manage Channels to do that.")
+
+@client.tree.command(name="help", description="Show the RNG GOOF commands")
+async def help_slash(interaction: discord.Interaction):
+    await respond(interaction, help_text(), ephemeral=True)
+
+# --- PREFIX COMMANDS ---
 async def on_message(message):
     if message.author == client.user:
         return
 
-    content = message.content.strip()
-    if not content.startswith("!rng.goof"):
+    with metrics.timer("rng_goof_stage_seconds", stage="parse"):
+        content = message.content.strip()
+        is_command = content.startswith("!rng.goof")
+    if not is_command:
         return
 
-    guild_id = message.guild.id if message.guild else None
-
     # --- HELP COMMAND ---
     if content == "!rng.goof help":
-        help_text = (
-            "**RNG GOOF Bot Commands:**\n"
-            "\n"
-            "`!rng.goof setup` - Set this channel as the roll channel.\n"
-            "`!rng.goof leaderboard top` - Show the top 10 all-time rolls.\n"
-            "`!rng.goof leaderboard 1000` - Show top 10 rolls with rarity ≥ 1,000.\n"
-            "`!rng.goof debug` - ???\n"
-            "`!rng.goof` or `!rng.goof <anything>` - Roll an item (except the above exceptions).\n"
-            "`!rng.goof help` - Show this message."
-        )
-        await message.channel.send(help_text)
+        outbox.post(message.channel, help_text())
         return
 
     # --- SETUP COMMAND ---
     if content == "!rng.goof setup":
-        if not guild_id:
-            await message.channel.send("You can only use this command in a server.")
-            return
-
-        perms = message.author.guild_permissions
-        if not (perms.manage_channels or perms.administrator):
-            return
-
-        async with file_lock:
-            roll_channels = await load_roll_channels()
-            roll_channels[str(guild_id)] = message.channel.id
-            ok = await save_roll_channels(roll_channels)
-            if ok:
-                await message.channel.send(f"This channel ({message.channel.mention}) is now the roll channel!")   
-            else:
-                await message.channel.send("Failed to save roll channel to GitHub.")
+        text = await setup_command(message.guild, message.channel, message.author)
+        if text:
+            outbox.post(message.channel, text)
         return
 
     # --- DEBUG COMMAND ---
     if content == "!rng.goof debug":
-        await message.channel.send(str(bot_id))
+        throttled = {reason: metrics.value("rng_goof_throttled_total", reason=reason) for reason in ("user", "guild", "global")}
+        await send(
+            message.channel,
+            f"{bot_id}\n"
+            f"-# shard {message.guild.shard_id if message.guild else 0} of {client.shard_count}"
+            f" / leased rolls {f'#{state.leases.next:,}-#{state.leases.end - 1:,}' if state.leases else 'off'}\n"
+            f"-# throttled: {throttled['user']:,} user / {throttled['guild']:,} server / {throttled['global']:,} global"
+            f" / tracking {len(limiter.users):,} cooldowns"
+        )
         return
 
-    # --- LEADERBOARD COMMAND ---
-    if content.startswith("!rng.goof leaderboard"):
-        async with file_lock:
-            # Determine type
-            if content.endswith("top"):
-                stats = await load_stats()
-                leaderboard = sorted(stats.get('leaderboard', []), key=lambda x: x['rarity'], reverse=True)
-                title = "RNG GOOF TOP 10 LEADERBOARD"
-                footer_text = f"Total Rolls: {stats.get('total_rolls', 0):,}"
-            elif content.endswith("1000"):
-                top_1000 = await load_top_1000()
-                leaderboard = sorted(top_1000.get('leaderboard', []), key=lambda x: x['rarity'], reverse=True)
-                title = "RNG GOOF 1000+ RARITY LEADERBOARD"
-                footer_text = ""
-            else:
-                await message.channel.send("Unknown leaderboard type. Use `top` or `1000`.")
-                return
-    
-            if not leaderboard:
-                await message.channel.send("No rolls yet 😔")
+    # --- USER STATS COMMAND ---
+    if content == "!rng.goof me" or content.startswith("!rng.goof user"):
+        if content == "!rng.goof me":
+            target_id, target_name = message.author.id, message.author.display_name
+        elif message.mentions:
+            target_id, target_name = message.mentions[0].id, message.mentions[0].display_name
+        else:
+            arg = content[len("!rng.goof user"):].strip().strip("<@!>")
+            if not arg.isdigit():
+                outbox.post(message.channel, "Usage: `!rng.goof user @someone`")
                 return
-    
-            # --- Build paginated embed pages ---
-            page_size = 10
-            pages = []
-            for i in range(0, len(leaderboard), page_size):
-                chunk = leaderboard[i:i + page_size]
-                description = ""
-                for j, roll in enumerate(chunk, start=i + 1):
-                    timestamp = int(roll['timestamp'])
-                    roll_name = roll['name']
-                    roll_rarity = int(roll['rarity'])
-                    display_name = f"**{roll_name.upper()}**" if roll_rarity >= 1000 else roll_name
-                    description += (
-                        f"#{j} - {display_name} (1 in {roll_rarity:,})\n"
-                        f"Rolled by {roll['user']} at <t:{timestamp}> in {roll['server']} / All-Time Roll #{roll['roll_number']:,}\n\n"
-                    )
-                embed = discord.Embed(
-                    title=title,
-                    description=description,
-                    color=discord.Color.gold()
-                )
-                embed.set_footer(text=f"{footer_text} | Page {i//page_size + 1}/{(len(leaderboard)-1)//page_size + 1}")
-                pages.append(embed)
-    
-            # Send first page
-            current_page = 0
-            leaderboard_msg = await message.channel.send(embed=pages[current_page])
-            
-            if content.endswith("1000"):
-                prev_button = Button(label="⬅️ Prev", style=discord.ButtonStyle.primary)
-                next_button = Button(label="Next ➡️", style=discord.ButtonStyle.primary)
-                jump_page_button = Button(label="Jump to Page", style=discord.ButtonStyle.secondary)
-                jump_rank_button = Button(label="Jump to Rank", style=discord.ButtonStyle.secondary)
-            
-                async def prev_callback(interaction):
-                    nonlocal current_page
-                    current_page = (current_page - 1) % len(pages)
-                    await leaderboard_msg.edit(embed=pages[current_page])
-                    await interaction.response.defer()
-            
-                async def next_callback(interaction):
-                    nonlocal current_page
-                    current_page = (current_page + 1) % len(pages)
-                    await leaderboard_msg.edit(embed=pages[current_page])
-                    await interaction.response.defer()
-            
-                async def jump_page_callback(interaction):
-                    nonlocal current_page
-                    await interaction.response.send_message("Enter page number:", ephemeral=True)
-            
-                    def check(m):
-                        return m.author == interaction.user and m.channel == interaction.channel
-            
-                    try:
-                        msg = await client.wait_for("message", check=check, timeout=30)
-                        page_num = int(msg.content.strip())
-                        if 1 <= page_num <= len(pages):
-                            current_page = page_num - 1
-                            await leaderboard_msg.edit(embed=pages[current_page])
-                            await msg.delete()
-                        else:
-                            await interaction.followup.send("Invalid page number.", ephemeral=True)
-                    except (ValueError, asyncio.TimeoutError):
-                        await interaction.followup.send("Cancelled or invalid input.", ephemeral=True)
-            
-                async def jump_rank_callback(interaction):
-                    nonlocal current_page
-                    await interaction.response.send_message("Enter rank number (#):", ephemeral=True)
-            
-                    def check(m):
-                        return m.author == interaction.user and m.channel == interaction.channel
-            
-                    try:
-                        msg = await client.wait_for("message", check=check, timeout=30)
-                        rank_num = int(msg.content.strip())
-                        if 1 <= rank_num <= len(leaderboard):
-                            index = rank_num - 1
-                            current_page = index // page_size
-                            await leaderboard_msg.edit(embed=pages[current_page])
-                            await msg.delete()
-                            await interaction.followup.send(f"Jumped to rank #{rank_num} (page {current_page + 1}).", ephemeral=True)
-                        else:
-                            await interaction.followup.send("Invalid rank number.", ephemeral=True)
-                    except (ValueError, asyncio.TimeoutError):
-                        await interaction.followup.send("Cancelled or invalid input.", ephemeral=True)
-            
-                prev_button.callback = prev_callback
-                next_button.callback = next_callback
-                jump_page_button.callback = jump_page_callback
-                jump_rank_button.callback = jump_rank_callback
-            
-                view = View()
-                view.add_item(prev_button)
-                view.add_item(next_button)
-                view.add_item(jump_page_button)
-                view.add_item(jump_rank_button)
-                await leaderboard_msg.edit(view=view)
-            
-                async def disable_buttons():
-                    await asyncio.sleep(120)
-                    for item in view.children:
-                        item.disabled = True
-                    await leaderboard_msg.edit(view=view)
-            
-                client.loop.create_task(disable_buttons())
-            return
+            target_id, target_name = int(arg), arg
+        result = await stats_command(target_id, target_name)
+        if isinstance(result, str):
+            outbox.post(message.channel, result)
+        else:
+            await send(message.channel, embed=result)
+        return
 
-    # --- ROLL ITEM (default) ---
-    now = asyncio.get_running_loop().time()
-    last_roll = cooldowns.get(message.author.id)
-    if last_roll and now - last_roll < COOLDOWN_SECONDS:
-        await message.channel.send(f"nrn bozo {message.author.mention}")
+    # --- ODDS COMMAND ---
+    if content == "!rng.goof odds" or content.startswith("!rng.goof odds "):
+        outbox.post(message.channel, odds_command(content[len("!rng.goof odds"):]))
         return
-    cooldowns[message.author.id] = now
 
-    async with file_lock:
-        # Roll the item
-        name, rarity = roll_item_once()
-        
-        stats = await load_stats()
-        stats['total_rolls'] += 1
-        roll_number = stats['total_rolls']
-        timestamp_unix = int(datetime.utcnow().timestamp())
-        roll_data = {
-            'name': name,
-            'rarity': rarity,
-            'user': str(message.author),
-            'user_id': message.author.id,
-            'server': message.guild.name if message.guild else 'DM',
-            'timestamp': timestamp_unix,
-            'roll_number': roll_number
-        }
-        rank = update_leaderboard(stats, roll_data)
-        await save_stats(stats)
-
-        response_percentile = ""
-        # Update top 1000 leaderboard if applicable
-        if rarity >= 1000:
-            top_1000 = await load_top_1000()
-            update_top_1000_leaderboard(top_1000, roll_data)
-            await save_top_1000(top_1000)
-
-            all_rarities = sorted([r['rarity'] for r in top_1000.get('leaderboard', [])], reverse=True)
-            if all_rarities:
-                better_count = sum(1 for r in all_rarities if r >= rarity)
-                percentile = 100 * better_count / len(all_rarities)
-                percentile_display = round(percentile)
-                response_percentile = f"\n-# This roll is good for top {percentile_display}% (#{better_count}) of 1000+ rarity rolls"
+    # --- LEADERBOARD COMMAND ---
+    if content.startswith("!rng.goof leaderboard"):
+        kind = "top" if content.endswith("top") else "1000" if content.endswith("1000") else None
 
-    display_name = f"**{name.upper()}**" if rarity >= 1000 else name
-    response = f'-# RNG GOOF / <@{message.author.id}> / All-Time Roll #{roll_number:,}\n{display_name} (1 in {rarity:,})'
-    if rank:
-        response += f'\n**This roll is good for #{rank} on the RNG GOOF leaderboard**'
+        async def reply(**kwargs):
+            await send(message.channel, **kwargs)
 
-    response += response_percentile
-    await message.channel.send(response)
+        error = await leaderboard_command(kind, reply)
+        if error:
+            outbox.post(message.channel, error)
+        return
 
-# --- RUN BOT ---
-if not DISCORD_TOKEN:
-    exit(1)
+    # --- ROLL ITEM (default) ---
+    parts = content.split()
+    count = 1
+    if len(parts) == 3 and parts[1] == "roll" and parts[2].isdigit() and int(parts[2]) > 1:
+        count = min(int(parts[2]), MAX_BATCH_ROLLS)
+    reply, notice = await roll_command(message.author, message.guild, message.channel.id, count)
+    if notice:
+        outbox.post(message.channel, notice, message.author.mention)
+    else:
+        outbox.post(message.channel, reply)
+
+if PREFIX_COMMANDS:
+    client.event(on_message)
 
+# --- RUN BOT ---
 if __name__ == "__main__":
-    keep_alive()
+    if not DISCORD_TOKEN:
+        exit(1)
     client.run(DISCORD_TOKEN)
-
-
@@ -0,0 +1,71 @@
+# Convert the old whole-document files (stats.json, top_1000.json,
+# roll_channels.json) into the local snapshot + roll journal format, or into
+# a SQLite database for STORAGE_BACKEND=sqlite.
+#
+#   python migrate.py [--stats stats.json] [--top top_1000.json]
+#                     [--channels roll_channels.json] [--out data | --sqlite db]
+#
+# The bot picks the result up from DATA_DIR / SQLITE_PATH on its next start
+# instead of downloading the documents from GitHub.
+import argparse
+import json
+import os
+
+import main
+
+
+def read_json(path, default):
+    if not path or not os.path.exists(path):
+        return default
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def migrate(stats_path, top_path, channels_path, out_dir=None, sqlite_path=None):
+    stats = read_json(stats_path, {"total_rolls": 0, "leaderboard": []})
+    top_1000 = read_json(top_path, {"leaderboard": []})
+    roll_channels = read_json(channels_path, {})
+    roll_channels.pop("_sha", None)
+
+    top10 = main.Leaderboard(stats.get("leaderboard", []), capacity=10)
+    board = main.Leaderboard(top_1000.get("leaderboard", []))
+    total_rolls = max([stats.get("total_rolls", 0)] + [r["roll_number"] for r in board.entries])
+
+    if sqlite_path:
+        storage = main.SQLiteStorage(sqlite_path)
+        storage.seed({
+            "roll_counts": {"base": total_rolls},
+            "last_roll": total_rolls,
+            "leaderboard": top10.entries,
+            "top_1000": board.entries,
+            "roll_channels": roll_channels
+        })
+        storage.db.close()
+    else:
+        journal = main.RollJournal(out_dir)
+        journal.write_snapshot(main.make_snapshot({"base": total_rolls}, total_rolls, top10.entries, board.entries, roll_channels))
+        journal.close()
+    return total_rolls, len(top10), len(board)
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Migrate RNG GOOF JSON documents to snapshot + journal")
+    parser.add_argument("--stats", default=main.STATS_PATH)
+    parser.add_argument("--top", default=main.TOP_1000_PATH)
+    parser.add_argument("--channels", default=main.ROLL_CHANNELS_PATH)
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--out", default=main.DATA_DIR)
+    target.add_argument("--sqlite")
+    args = parser.parse_args()
+
+    if args.sqlite:
+        if os.path.exists(args.sqlite):
+            parser.error(f"{args.sqlite} already exists; remove it first")
+    elif main.RollJournal(args.out).exists():
+        parser.error(f"{args.out} already has a snapshot; remove it first")
+    total_rolls, top10, board = migrate(args.stats, args.top, args.channels, args.out, args.sqlite)
+    print(f"Wrote {args.sqlite or args.out}: {total_rolls:,} total rolls, {top10} top 10 entries, {board:,} 1000+ entries")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,92 @@
+# Bulk roll simulator for checking the rarities/modifiers tables.
+#
+#   python simulate.py -n 50000000
+#
+# Rolls millions of items at once with NumPy, using the same compiled tables as
+# the bot (main.roll_engine), and prints empirical vs theoretical frequencies
+# for every tier and modifier. Needs numpy (pip install numpy); the bot itself
+# does not.
+import argparse
+import time
+
+import numpy as np
+
+import main
+
+
+class BatchRoller:
+    def __init__(self, engine):
+        self.engine = engine
+        self.tier_values = np.array(engine.tier_values, dtype=np.float64)
+        tier_weights = 1.0 / self.tier_values
+        self.tier_p = tier_weights / tier_weights.sum()
+        self.tier_cdf = np.cumsum(tier_weights)
+        self.mod_values = np.array(engine.mod_values, dtype=np.float64)
+        self.mod_p = 1.0 / self.mod_values
+        self.mod_bits = np.left_shift(np.uint32(1), np.arange(len(self.mod_values), dtype=np.uint32))
+
+    def roll(self, n, rng):
+        # base tier: same "first cumulative weight >= r" rule as the old linear scan
+        r = rng.random(n) * self.tier_cdf[-1]
+        tiers = np.searchsorted(self.tier_cdf, r, side="left")
+        np.minimum(tiers, len(self.tier_cdf) - 1, out=tiers)
+
+        hits = rng.random((n, len(self.mod_p))) < self.mod_p
+        masks = (hits * self.mod_bits).sum(axis=1, dtype=np.uint32)
+        multipliers = np.where(hits, self.mod_values, 1.0).prod(axis=1)
+        rarity = self.tier_values[tiers] * multipliers
+        return tiers, hits, masks, rarity
+
+
+def simulate(n, seed=None, chunk=1_000_000):
+    roller = BatchRoller(main.roll_engine)
+    rng = np.random.default_rng(seed)
+    tier_counts = np.zeros(len(roller.tier_p), dtype=np.int64)
+    mod_counts = np.zeros(len(roller.mod_p), dtype=np.int64)
+    thresholds = [10 ** k for k in range(3, 10)]
+    tail_counts = np.zeros(len(thresholds), dtype=np.int64)
+    best = 0.0
+    done = 0
+    while done < n:
+        size = min(chunk, n - done)
+        tiers, hits, _, rarity = roller.roll(size, rng)
+        tier_counts += np.bincount(tiers, minlength=len(tier_counts))
+        mod_counts += hits.sum(axis=0)
+        tail_counts += np.array([(rarity >= t).sum() for t in thresholds])
+        best = max(best, rarity.max())
+        done += size
+    return roller, tier_counts, mod_counts, list(zip(thresholds, tail_counts)), best
+
+
+def print_table(title, names, counts, probs, n):
+    print(f"\n{title}")
+    print(f"{'name':<14}{'count':>14}{'expected':>16}{'empirical':>14}{'theoretical':>14}{'ratio':>8}")
+    for name, count, p in zip(names, counts, probs):
+        expected = p * n
+        ratio = f"{count / expected:.3f}" if expected else "-"
+        print(f"{name:<14}{count:>14,}{expected:>16,.1f}{count / n:>14.3e}{p:>14.3e}{ratio:>8}")
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Validate RNG GOOF roll odds by bulk simulation")
+    parser.add_argument("-n", "--rolls", type=int, default=10_000_000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--chunk", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    roller, tier_counts, mod_counts, tails, best = simulate(args.rolls, args.seed, args.chunk)
+    elapsed = time.perf_counter() - start
+
+    engine = roller.engine
+    print(f"{args.rolls:,} rolls in {elapsed:.2f}s ({args.rolls / elapsed:,.0f} rolls/sec)")
+    print_table("Base rarity tiers", engine.tier_names, tier_counts, roller.tier_p, args.rolls)
+    print_table("Modifiers", engine.mod_names, mod_counts, roller.mod_p, args.rolls)
+    print("\nTotal rarity tail")
+    for threshold, count in tails:
+        print(f"  >= {threshold:>13,}: {count:>12,} ({count / args.rolls:.3e})")
+    print(f"  best: 1 in {int(best):,}")
+
+
+if __name__ == "__main__":
+    run()